@@ -4,6 +4,12 @@
 #define NUM_INPUT_PORTS 3 
 #define MAX_ACTUATORS 5
 
+// Binary configuration frame (matrixProtocol.py): sync, sequence, rows, cols, one signed byte per port, CRC-16
+#define FRAME_SYNC_1 0xA5
+#define FRAME_SYNC_2 0x5A
+#define FRAME_HEADER 5
+#define FRAME_SIZE (FRAME_HEADER + MAX_ACTUATORS * NUM_INPUT_PORTS + 2)
+
 const int port = 6;   //Digital ID Pin
 bool pairMode = false;  
 bool controlPresent = false;
@@ -11,6 +17,7 @@ bool present = false;
 
 int configurationMatrix[MAX_ACTUATORS][NUM_INPUT_PORTS]; 
 int commandMatrix[MAX_ACTUATORS][NUM_INPUT_PORTS];
+uint8_t frameSequence = 0;
 
 void setup() {
   Serial.begin(9600);
@@ -88,17 +95,36 @@ void printConfigurationMatrix() {
   }
 }
 
+// CRC-16/CCITT-FALSE (polynomial 0x1021, initial value 0xFFFF)
+uint16_t crc16(const uint8_t *data, int length) {
+  uint16_t crc = 0xFFFF;
+  for (int i = 0; i < length; i++) {
+    crc ^= (uint16_t)data[i] << 8;
+    for (int bit = 0; bit < 8; bit++) {
+      crc = (crc & 0x8000) ? (crc << 1) ^ 0x1021 : crc << 1;
+    }
+  }
+  return crc;
+}
+
 void send_matrix(){
-  // Send the matrix to the serial port
+  // Send the matrix to the serial port as one binary frame
+  uint8_t frame[FRAME_SIZE];
+  int k = 0;
+  frame[k++] = FRAME_SYNC_1;
+  frame[k++] = FRAME_SYNC_2;
+  frame[k++] = frameSequence++;
+  frame[k++] = MAX_ACTUATORS;
+  frame[k++] = NUM_INPUT_PORTS;
   for (int i = 0; i < MAX_ACTUATORS; i++) {
     for (int j = 0; j < NUM_INPUT_PORTS; j++) {
-      Serial.print(configurationMatrix[i][j]);
-      if (j < NUM_INPUT_PORTS-1) {
-        Serial.print(",");  // Separate elements by commas
-      }
+      frame[k++] = (uint8_t)(int8_t)configurationMatrix[i][j];  // Negative values flip the orientation
     }
-    Serial.println();  // Newline at the end of each row
   }
+  uint16_t crc = crc16(frame + 2, k - 2);  // Everything after the sync marker
+  frame[k++] = crc >> 8;
+  frame[k++] = crc & 0xFF;
+  Serial.write(frame, k);
   
   delay(100);  
 }
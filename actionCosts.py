@@ -0,0 +1,115 @@
+# Expected durations of actions for duration-weighted planning.
+#
+# Connecting to the control module or with orientation O2 takes much longer on
+# the hardware than a disconnect, so plans are weighted by expected seconds
+# instead of counted in steps (see ModelChecker.check_reachability with
+# strategy='dijkstra'). A cost is looked up, most specific first, as:
+#
+#   learned mean for the action (at least min_samples measurements)
+#   configured cost for the action
+#   learned mean for the action type
+#   configured cost for the action type
+#   default
+#
+# The action types are 'disconnect', 'connect_control', 'connect_O1' and
+# 'connect_O2'. Costs are stored as JSON:
+#
+#   {"default": 1.0,
+#    "types": {"disconnect": 1.5, "connect_control": 6.0},
+#    "actions": {"connect_M2_P1_M1_P4_O2": 9.0},
+#    "samples": {"disconnect": [12, 1.42], ...}}   # learned: [count, mean seconds]
+#
+# Cached plans are keyed by signature(), a hash of the effective costs rounded
+# to resolution seconds, so recording a step only invalidates them once a
+# learned mean has actually moved.
+
+import hashlib
+import json
+
+ACTION_TYPES = ('disconnect', 'connect_control', 'connect_O1', 'connect_O2')
+
+
+def action_type(action):
+    parts = action.split('_')
+    if parts[0] == 'disconnect':
+        return 'disconnect'
+    if parts[3] == 'M0':
+        return 'connect_control'
+    return f'connect_{parts[5]}'
+
+
+class ActionCosts:
+    def __init__(self, default=1.0, types=None, actions=None, min_samples=3, resolution=0.5):
+        self.default = default
+        self.types = dict(types or {})          # action type -> seconds
+        self.actions = dict(actions or {})      # action -> seconds
+        self.min_samples = min_samples
+        self.resolution = resolution            # Seconds the signature rounds costs to
+        self.samples = {}                       # action or action type -> [count, mean seconds]
+
+    def _learned(self, key):
+        sample = self.samples.get(key)
+        if sample is not None and sample[0] >= self.min_samples:
+            return sample[1]
+        return None
+
+    def __call__(self, action):
+        cost = self._learned(action)
+        if cost is None:
+            cost = self.actions.get(action)
+        if cost is None:
+            cost = self.type_cost(action_type(action))
+        return cost
+
+    def type_cost(self, kind):
+        cost = self._learned(kind)
+        if cost is None:
+            cost = self.types.get(kind, self.default)
+        return cost
+
+    def record(self, action, seconds):
+        """Adds a measured duration to the running means of the action and of its type."""
+        for key in (action, action_type(action)):
+            count, mean = self.samples.get(key, (0, 0.0))
+            count += 1
+            self.samples[key] = [count, mean + (seconds - mean) / count]
+
+    def record_log(self, log):
+        """Learns from a PlanExecutor log. Only completed single action steps are used, the
+        duration of a group of concurrent actions does not say which action took how long."""
+        for actions, _, _, outcome, seconds in log:
+            if outcome == 'ok' and len(actions) == 1:
+                self.record(actions[0], seconds)
+
+    def signature(self):
+        """Hash of the effective costs rounded to resolution seconds, used to key cached plans."""
+        def rounded(cost):
+            return round(cost / self.resolution)
+        actions = set(self.actions) | {key for key in self.samples
+                                       if key not in ACTION_TYPES and self._learned(key) is not None}
+        types = {kind: rounded(self.type_cost(kind)) for kind in ACTION_TYPES}
+        # Actions that cost the same as their type do not change any plan
+        actions = {action: rounded(self(action)) for action in actions}
+        actions = {action: cost for action, cost in actions.items() if cost != types[action_type(action)]}
+        data = json.dumps({'default': rounded(self.default), 'types': types, 'actions': actions}, sort_keys=True)
+        return hashlib.sha256(data.encode()).hexdigest()
+
+    def to_dict(self):
+        return {'default': self.default, 'types': self.types, 'actions': self.actions,
+                'min_samples': self.min_samples, 'resolution': self.resolution, 'samples': self.samples}
+
+    @classmethod
+    def from_dict(cls, data):
+        costs = cls(data.get('default', 1.0), data.get('types'), data.get('actions'), data.get('min_samples', 3),
+                    data.get('resolution', 0.5))
+        costs.samples = {key: list(sample) for key, sample in data.get('samples', {}).items()}
+        return costs
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
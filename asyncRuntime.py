@@ -0,0 +1,172 @@
+# asyncio runtime for plan execution.
+#
+# PlanExecutor.run polls: read a matrix, sleep, check, repeat, so every step
+# costs at least one poll interval. Here reading, decoding, sending, plotting
+# and plan progress are separate tasks connected by queues:
+#
+#   reader   waits for frames from the SerialConnection reader thread, or with a
+#            ChangeDetector only receives its change events (see changeDetector.py)
+#   decoder  turns each matrix into a state and wakes up the progress task
+#   sender   writes command matrices
+#   plotter  plots the newest matrices, dropping frames it cannot keep up with
+#   progress chooses the next step (PlanExecutor.next_step) and advances as soon
+#            as a decoded state settles the step, or fails it at its deadline
+#
+# A failed serial read, malformed matrix or failed write is raised by run()
+# instead of leaving the progress task waiting on a dead task.
+#
+#   runner = AsyncPlanRunner(executor, connection)
+#   reached = asyncio.run(runner.run(initial_state))
+
+import asyncio
+
+
+class AsyncPlanRunner:
+    def __init__(self, executor, connection, frame_timeout=0.5, plot_queue_size=4, detector=None):
+        self.executor = executor        # Planning, step bookkeeping and the send/plot callbacks
+        self.connection = connection    # SerialConnection (wait_for_frame)
+        self.detector = detector        # ChangeDetector fed by the connection: decode and plot changes only
+        self.frame_timeout = frame_timeout
+        self.plot_queue_size = plot_queue_size
+        self.state = None
+        self.state_count = 0            # Number of states decoded so far
+        self.error = None               # Exception that stopped the reader or decoder, raised by next_state
+
+    async def _fail(self, changed, error):
+        # Wakes up next_state so the error is raised in run() instead of every step timing out
+        async with changed:
+            self.error = error
+            changed.notify_all()
+
+    async def _reader(self, matrices, plots, changed):
+        after = self.connection.sequence
+        while True:
+            # The serial thread blocks, so the wait runs in a worker thread with a short timeout
+            try:
+                sequence, matrix = await asyncio.to_thread(self.connection.wait_for_frame, after, self.frame_timeout)
+            except Exception as e:
+                await self._fail(changed, e)
+                return
+            if matrix is None:
+                continue
+            after = sequence
+            self._enqueue(matrix, matrices, plots)
+
+    def _enqueue(self, matrix, matrices, plots):
+        matrices.put_nowait(matrix)
+        if self.executor.on_matrix is not None:
+            if plots.full():
+                plots.get_nowait()  # Plotting is behind, keep the newest frames
+            plots.put_nowait(matrix)
+
+    async def _decoder(self, matrices, changed):
+        while True:
+            matrix = await matrices.get()
+            try:
+                state = self.executor.matrix_to_state(matrix)
+            except Exception as e:
+                await self._fail(changed, e)
+                return
+            async with changed:
+                self.state = state
+                self.state_count += 1
+                changed.notify_all()
+
+    async def _sender(self, commands):
+        while True:
+            actions, sent = await commands.get()
+            try:
+                await asyncio.to_thread(self.executor.send_actions, actions)
+            except Exception as e:
+                sent.set_exception(e)   # Raised by the progress task waiting for the send
+                continue
+            sent.set_result(asyncio.get_running_loop().time())
+
+    async def _plotter(self, plots):
+        while True:
+            self.executor.on_matrix(await plots.get())
+
+    async def next_state(self, changed, seen, deadline):
+        """Waits until a state newer than the seen count is decoded. Raises asyncio.TimeoutError at the deadline,
+        or the error that stopped the reader or decoder."""
+        loop = asyncio.get_running_loop()
+        async with changed:
+            await asyncio.wait_for(changed.wait_for(lambda: self.state_count > seen or self.error is not None),
+                                   max(0.0, deadline - loop.time()))
+            if self.error is not None:
+                raise self.error
+            return self.state, self.state_count
+
+    async def _progress(self, state, commands, changed):
+        executor = self.executor
+        loop = asyncio.get_running_loop()
+        seen = self.state_count
+        failures = 0
+        if state is None:
+            try:
+                state, seen = await self.next_state(changed, seen, loop.time() + executor.step_timeout)
+            except asyncio.TimeoutError:
+                print("No configuration matrix received from the control module")
+                return False
+
+        while state != executor.desired_state:
+            step = executor.next_step(state)
+            if step is None:
+                print(f"The desired state {executor.desired_state} is not reachable from the observed state {state}")
+                return False
+            actions, expected = step
+
+            sent = loop.create_future()
+            await commands.put((actions, sent))
+            started = await sent
+            deadline = started + executor.step_timeout
+            observed = None
+            try:
+                while not executor.settled(state, expected, observed, len(actions) > 1):
+                    observed, seen = await self.next_state(changed, seen, deadline)
+            except asyncio.TimeoutError:
+                print(f"Step {actions} failed: expected {expected} within {executor.step_timeout}s")
+                executor.log.append((actions, expected, state, 'timeout', loop.time() - started))
+                failures += 1
+                if failures > executor.max_retries:
+                    return False
+                if self.state is not None:
+                    state = self.state
+                continue
+
+            if executor.record_step(actions, expected, observed, loop.time() - started):
+                failures = 0
+            else:
+                failures += 1
+                if failures > executor.max_retries:
+                    return False
+            state = observed
+        return True
+
+    async def run(self, state=None):
+        """Drives the hardware to the executor's desired state, see PlanExecutor.run."""
+        matrices = asyncio.Queue()
+        plots = asyncio.Queue(maxsize=self.plot_queue_size)
+        commands = asyncio.Queue()
+        changed = asyncio.Condition()
+        self.error = None
+
+        tasks = [asyncio.create_task(self._decoder(matrices, changed)),
+                 asyncio.create_task(self._sender(commands))]
+        if self.executor.on_matrix is not None:
+            tasks.append(asyncio.create_task(self._plotter(plots)))
+        if self.detector is not None:
+            # Change events arrive on the serial reader thread
+            loop = asyncio.get_running_loop()
+            on_change = self.detector.subscribe(
+                lambda matrix, previous: loop.call_soon_threadsafe(self._enqueue, matrix, matrices, plots))
+        else:
+            tasks.append(asyncio.create_task(self._reader(matrices, plots, changed)))
+        try:
+            return await self._progress(state, commands, changed)
+        finally:
+            if self.detector is not None:
+                self.detector.unsubscribe(on_change)
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,208 @@
+# Benchmark for state generation, transition export/import and model checking.
+#
+# Sweeps the number of modules and records wall time per phase, peak RSS and
+# state/transition counts. Every module count runs in its own process so peak
+# RSS is not shared between runs and a slow run can be cut off with --timeout.
+# Runs headless: matplotlib uses the Agg backend and no serial port is opened.
+#
+#   python benchmark.py --max-modules 3                  # writes benchmark_results.json
+#   python benchmark.py --max-modules 3 --save-baseline  # stores benchmark_baseline.json
+#
+# When a baseline file exists the results are compared against it and the exit
+# code is 1 if any phase got slower (or used more memory) than the tolerance.
+
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+os.environ.setdefault('MPLBACKEND', 'Agg')
+
+PHASES = ('generation', 'serialization', 'loading', 'planning')
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def planning_problem(num_modules):
+    # Module 1 on the control module, goal is a chain of all modules
+    initial_state = frozenset({('M1_P1', 'M0_P0_O1')})
+    desired_state = {('M1_P1', 'M0_P0_O1')}
+    for module in range(2, num_modules + 1):
+        desired_state.add((f'M{module}_P1', f'M{module-1}_P4_O1'))
+    return initial_state, frozenset(desired_state)
+
+
+def run_phases(num_modules, compact, workdir):
+    """Runs every phase for one module count, yields (phase, record) as each one finishes."""
+    from state_generator import stateGenerator
+    from main import DFA
+    from modelChecker import load_transitions, run_model_checker
+
+    bin_file = os.path.join(workdir, 'transitions.bin')
+    csv_file = os.path.join(workdir, 'transitions.csv')
+
+    start = time.perf_counter()
+    generator = stateGenerator(num_modules, compact=compact)
+    yield 'generation', {'seconds': time.perf_counter() - start,
+                         'states': len(generator.states),
+                         'transitions': len(generator.transitions)}
+
+    start = time.perf_counter()
+    generator.export_transitions(bin_file)
+    bin_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    generator.export_transitions(csv_file)
+    yield 'serialization', {'seconds': bin_seconds + time.perf_counter() - start,
+                            'binary_seconds': bin_seconds,
+                            'binary_bytes': os.path.getsize(bin_file),
+                            'csv_bytes': os.path.getsize(csv_file)}
+    encoder = generator.encoder
+    del generator
+
+    start = time.perf_counter()
+    dfa = DFA(encoder=encoder if compact else None)
+    dfa.import_transitions(bin_file)
+    transitions = load_transitions(bin_file, compact)
+    open_seconds = time.perf_counter() - start
+    # Both are lazy views of the store, so every row is decoded once here to keep the phase
+    # comparable with loading into dicts (this also fills the row cache used by planning)
+    table_rows = sum(1 for _ in dfa.transitions.items())
+    checker_rows = sum(len(edges) for edges in transitions.values())
+    yield 'loading', {'seconds': time.perf_counter() - start,
+                      'open_seconds': open_seconds,     # Opening the views without decoding
+                      'transitions': table_rows,
+                      'checker_transitions': checker_rows}
+    del dfa
+
+    initial_state, desired_state = planning_problem(num_modules)
+    if compact:
+        initial_state, desired_state = encoder.encode(initial_state), encoder.encode(desired_state)
+
+    start = time.perf_counter()
+    verified, state_path, action_path, unreachable_from = run_model_checker(transitions, {initial_state}, desired_state, printStat=False)
+    yield 'planning', {'seconds': time.perf_counter() - start,
+                       'verified': bool(verified),
+                       'unreachable_from': len(unreachable_from),
+                       'plan_length': len(action_path)}
+
+
+def run_child(num_modules, compact):
+    # Progress and results go to stdout as one JSON object per line, everything the
+    # pipeline prints itself is sent to stderr
+    results = sys.stdout
+    sys.stdout = sys.stderr
+    with tempfile.TemporaryDirectory() as workdir:
+        for phase, record in run_phases(num_modules, compact, workdir):
+            record['peak_rss_mb'] = peak_rss_mb()
+            results.write(json.dumps({'phase': phase, **record}) + '\n')
+            results.flush()
+
+
+def run_sweep(max_modules, compact, timeout):
+    results = {}
+    for num_modules in range(1, max_modules + 1):
+        command = [sys.executable, os.path.abspath(__file__), '--child', str(num_modules)]
+        if compact:
+            command.append('--compact')
+
+        print(f"Benchmarking {num_modules} module(s)...", file=sys.stderr)
+        try:
+            completed = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                       text=True, timeout=timeout, cwd=os.path.dirname(os.path.abspath(__file__)))
+            output, status = completed.stdout, 'ok' if completed.returncode == 0 else 'failed'
+        except subprocess.TimeoutExpired as e:
+            output = e.stdout.decode() if isinstance(e.stdout, bytes) else (e.stdout or '')
+            status = 'timeout'
+
+        phases = {}
+        for line in output.splitlines():
+            record = json.loads(line)
+            phases[record.pop('phase')] = record
+        results[str(num_modules)] = {'status': status, 'phases': phases}
+
+        if status != 'ok':
+            break   # Larger module counts will not do better
+    return results
+
+
+def compare(results, baseline, tolerance, min_seconds=0.05):
+    """Returns a list of regression messages against a stored baseline."""
+    regressions = []
+    for num_modules, run in results.items():
+        base_run = baseline.get('results', {}).get(num_modules)
+        if base_run is None:
+            continue
+        for phase in PHASES:
+            new, old = run['phases'].get(phase), base_run['phases'].get(phase)
+            if old is None:
+                continue
+            if new is None:
+                regressions.append(f"{num_modules} modules, {phase}: did not finish ({run['status']})")
+                continue
+            if new['seconds'] > old['seconds'] * (1 + tolerance) and new['seconds'] - old['seconds'] > min_seconds:
+                regressions.append(f"{num_modules} modules, {phase}: {old['seconds']:.3f}s -> {new['seconds']:.3f}s")
+            if new['peak_rss_mb'] > old['peak_rss_mb'] * (1 + tolerance):
+                regressions.append(f"{num_modules} modules, {phase}: peak RSS {old['peak_rss_mb']:.1f}MB -> {new['peak_rss_mb']:.1f}MB")
+    return regressions
+
+
+def print_table(results):
+    print(f"{'modules':>7} {'phase':<14} {'seconds':>10} {'peak MB':>9} {'states':>10} {'transitions':>12}")
+    for num_modules, run in results.items():
+        for phase in PHASES:
+            record = run['phases'].get(phase)
+            if record is None:
+                print(f"{num_modules:>7} {phase:<14} {run['status']:>10}")
+                continue
+            print(f"{num_modules:>7} {phase:<14} {record['seconds']:>10.3f} {record['peak_rss_mb']:>9.1f} "
+                  f"{record.get('states', ''):>10} {record.get('transitions', ''):>12}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark state generation, serialization, loading and planning.")
+    parser.add_argument('--max-modules', type=int, default=3)
+    parser.add_argument('--compact', action='store_true', help="Use packed integer states")
+    parser.add_argument('--timeout', type=float, default=600, help="Seconds allowed per module count")
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--baseline', default='benchmark_baseline.json')
+    parser.add_argument('--save-baseline', action='store_true', help="Store these results as the new baseline")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="Allowed relative slowdown before flagging")
+    parser.add_argument('--child', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        run_child(args.child, args.compact)
+        sys.exit(0)
+
+    results = run_sweep(args.max_modules, args.compact, args.timeout)
+    report = {
+        'meta': {'python': platform.python_version(), 'platform': platform.platform(),
+                 'compact': args.compact, 'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S')},
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print_table(results)
+    print(f"Results written to {args.output}")
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for message in regressions:
+            print(f"REGRESSION {message}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions against {args.baseline}")
@@ -0,0 +1,92 @@
+# Change detection between the serial reader and the consumers of matrices.
+#
+# The control module sends the configuration matrix every cycle whether or not
+# anything moved, and a connector that is being plugged in can chatter between
+# two readings for a few frames. The detector keeps the last stable matrix and
+# only reports a new one once it was read debounce frames in a row, so the
+# planner, plot and logger see one event per real change instead of decoding
+# every frame or a storm of connects and disconnects.
+#
+#   detector = ChangeDetector(debounce=2)
+#   connection.subscribe(detector.feed)          # Fed from the serial reader thread
+#   detector.subscribe(log_changes)              # callback(matrix, previous) per change
+
+import threading
+
+from matrixDecoding import matrix_diff
+
+
+def log_changes(matrix, previous):
+    """Subscriber that prints the actions behind every change."""
+    print(f"Configuration changed: {matrix_diff(previous, matrix)}")
+
+
+class ChangeDetector:
+    def __init__(self, debounce=2):
+        if debounce < 1:
+            raise ValueError("debounce has to be at least one frame")
+        self.debounce = debounce        # Frames in a row a new matrix has to be read before it is reported
+        self.stable = None              # Last reported matrix, None before the first one
+        self.version = 0                # Number of changes reported so far
+        self.frames = 0                 # Number of frames fed
+        self.transients = 0             # Readings that changed again before they were stable
+        self._candidate = None
+        self._count = 0
+        self._subscribers = []
+        self._condition = threading.Condition()
+
+    def subscribe(self, callback):
+        """Calls callback(matrix, previous) on every change, on the thread that feeds the detector."""
+        with self._condition:
+            self._subscribers.append(callback)
+        return callback
+
+    def unsubscribe(self, callback):
+        with self._condition:
+            self._subscribers.remove(callback)
+
+    def feed(self, matrix):
+        """Adds one frame. Returns True if it completed a change."""
+        matrix = [list(row) for row in matrix]      # Callers may reuse their rows
+        with self._condition:
+            self.frames += 1
+            if matrix == self.stable:
+                if self._candidate is not None:
+                    self.transients += 1    # Chatter that went back to the stable reading
+                self._candidate, self._count = None, 0
+                return False
+            if matrix != self._candidate:
+                if self._candidate is not None:
+                    self.transients += 1
+                self._candidate, self._count = matrix, 0
+            self._count += 1
+            if self._count < self.debounce:
+                return False
+
+            previous, self.stable = self.stable, matrix
+            self._candidate, self._count = None, 0
+            self.version += 1
+            subscribers = list(self._subscribers)
+            self._condition.notify_all()
+
+        # Outside the lock so subscribers can read the detector
+        for callback in subscribers:
+            callback(matrix, previous)
+        return True
+
+    def wait_for_change(self, after=None, timeout=None):
+        """Waits for a change newer than version after (default: the current one).
+        Returns (version, matrix), or (version, None) on timeout."""
+        with self._condition:
+            if after is None:
+                after = self.version
+            self._condition.wait_for(lambda: self.version > after, timeout)
+            if self.version > after:
+                return self.version, self.stable
+            return self.version, None
+
+    def read_matrix(self, timeout=None):
+        """Stable matrix, waiting for the first one if nothing was reported yet."""
+        with self._condition:
+            self._condition.wait_for(lambda: self.stable is not None, timeout)
+            return self.stable
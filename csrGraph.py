@@ -0,0 +1,140 @@
+# Integer-indexed transition graph in CSR form.
+#
+# States are numbered 0..n-1 and the successors of state i are
+# indices[indptr[i]:indptr[i+1]], with the action of each edge in
+# edge_actions (an index into action_names). This is the layout of the
+# binary transition store, so a TransitionStore can be wrapped without
+# copying, and ModelChecker style dicts are converted once.
+
+import numpy as np
+
+
+class CSRGraph:
+    def __init__(self, states, indptr, indices, edge_actions, action_names):
+        self.states = states                  # Index -> state (frozenset or packed int)
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices)
+        self.edge_actions = np.asarray(edge_actions)
+        self.action_names = action_names
+        self._index = None
+        self._sources = None
+
+    @classmethod
+    def from_checker_transitions(cls, transitions, states=None):
+        """Builds the graph from a {state: [(action, state)]} dict. Extra states without
+        outgoing edges can be passed in states."""
+        index = {}
+        for state in list(states or []) + list(transitions):
+            index.setdefault(state, len(index))
+        for edges in transitions.values():
+            for _, successor in edges:
+                index.setdefault(successor, len(index))
+
+        action_index = {}
+        counts = np.zeros(len(index), dtype=np.int64)
+        indices, edge_actions = [], []
+        for state, edges in transitions.items():
+            counts[index[state]] = len(edges)
+        # Edges have to be laid out in state index order
+        ordered = sorted(transitions.items(), key=lambda item: index[item[0]])
+        for _, edges in ordered:
+            for action, successor in edges:
+                indices.append(index[successor])
+                edge_actions.append(action_index.setdefault(action, len(action_index)))
+
+        indptr = np.concatenate(([0], np.cumsum(counts)))
+        graph = cls(list(index), indptr, np.array(indices, dtype=np.uint32),
+                    np.array(edge_actions, dtype=np.uint32), list(action_index))
+        graph._index = index
+        return graph
+
+    @classmethod
+    def from_store(cls, store, compact=False):
+        """Wraps the memory-mapped arrays of a TransitionStore."""
+        return cls(store.all_states(compact), store.indptr, store.indices, store.edge_actions, store.action_names)
+
+    def __len__(self):
+        return len(self.states)
+
+    @property
+    def num_edges(self):
+        return len(self.indices)
+
+    @property
+    def index(self):
+        """{state: index}"""
+        if self._index is None:
+            self._index = {state: idx for idx, state in enumerate(self.states)}
+        return self._index
+
+    @property
+    def sources(self):
+        """Source state of every edge, the row index of the CSR matrix."""
+        if self._sources is None:
+            self._sources = np.repeat(np.arange(len(self.states), dtype=np.int64), np.diff(self.indptr))
+        return self._sources
+
+    def out_degree(self):
+        return np.diff(self.indptr)
+
+    def successors(self, idx):
+        start, end = self.indptr[idx], self.indptr[idx + 1]
+        return [(self.action_names[a], int(t)) for a, t in zip(self.edge_actions[start:end], self.indices[start:end])]
+
+    def frontier_edges(self, frontier):
+        """Edge ids leaving the states in frontier, grouped by state in frontier order."""
+        starts = self.indptr[frontier]
+        counts = self.indptr[frontier + 1] - starts
+        offsets = np.cumsum(counts) - counts
+        return np.arange(counts.sum(), dtype=np.int64) + np.repeat(starts - offsets, counts), counts
+
+    def bfs(self, sources, target=None):
+        """Breadth-first search that expands a whole frontier per step.
+        sources are state indices. Returns (distances, parents, parent_edges, expanded) as arrays
+        over state indices, with -1 for unreached states and for the sources' parents. The action
+        into state i is action_names[edge_actions[parent_edges[i]]]. Stops after the layer that
+        reaches target, if given."""
+        n = len(self.states)
+        distances = np.full(n, -1, dtype=np.int64)
+        parents = np.full(n, -1, dtype=np.int64)
+        parent_edges = np.full(n, -1, dtype=np.int64)
+
+        frontier = np.unique(np.asarray(sources, dtype=np.int64))
+        distances[frontier] = 0
+        expanded = 0
+        depth = 0
+        while len(frontier) and (target is None or distances[target] < 0):
+            expanded += len(frontier)
+            edges, counts = self.frontier_edges(frontier)
+            targets = self.indices[edges].astype(np.int64)
+            new = distances[targets] < 0
+            targets, edges = targets[new], edges[new]
+            # Scatter in reverse so the first edge into each new state is the one kept, then
+            # every state is listed once by keeping the edges that won
+            parent_edges[targets[::-1]] = edges[::-1]
+            reached = targets[parent_edges[targets] == edges]
+            depth += 1
+            distances[reached] = depth
+            parents[reached] = self.sources[parent_edges[reached]]
+            frontier = reached
+        return distances, parents, parent_edges, expanded
+
+    def path(self, parents, parent_edges, idx):
+        """[(state, action)] from a BFS source to state index idx, same format as ModelChecker paths."""
+        path = []
+        while idx >= 0:
+            edge = parent_edges[idx]
+            path.append((self.states[idx], self.action_names[self.edge_actions[edge]] if edge >= 0 else None))
+            idx = parents[idx]
+        path.reverse()
+        return path
+
+    def label(self, predicate):
+        """Boolean array of the states satisfying predicate(state)."""
+        return np.fromiter((bool(predicate(state)) for state in self.states), dtype=bool, count=len(self.states))
+
+    def mask(self, states):
+        """Boolean array of a collection of states."""
+        result = np.zeros(len(self.states), dtype=bool)
+        result[[self.index[state] for state in states if state in self.index]] = True
+        return result
@@ -0,0 +1,296 @@
+# Disk-backed state set and transition map for stateGenerator(storage='disk').
+#
+# Both live in one SQLite file. States are stored as fixed width big-endian
+# packed codes (see stateEncoding.py), so they sort numerically and take a
+# few bytes each. Transitions are buffered and written out in batches instead
+# of being kept in memory. A bounded LRU cache in front of the state table
+# answers membership checks for recently seen states without a query, and a
+# fixed size Bloom filter rejects most states that were never added (most
+# candidate successors are invalid) without touching the disk. The binary
+# transition store is exported straight from the tables (export_store).
+
+import os
+import sqlite3
+from collections import OrderedDict
+
+import numpy as np
+
+from transitionStore import stream_transition_store
+
+BATCH_SIZE = 10000
+FILTER_HASHES = 3
+
+
+class DiskStore:
+    def __init__(self, path, encoder, compact=False, temporary=False, connection=None, suffix=''):
+        self.path = path
+        self.encoder = encoder
+        self.compact = compact
+        self.temporary = temporary      # The file is deleted by close()
+        self.state_bytes = max(1, -(-encoder.num_slots * encoder.slot_bits // 8))
+        self.states_table = f'states{suffix}'
+        self.transitions_table = f'transitions{suffix}'
+        self.suffix = suffix
+
+        if connection is None:
+            connection = sqlite3.connect(path)
+            # Scratch data, durability is not needed
+            connection.execute('PRAGMA journal_mode=OFF')
+            connection.execute('PRAGMA synchronous=OFF')
+        self.connection = connection
+        self._create_tables()
+
+    def _create_tables(self):
+        self.connection.execute(f'CREATE TABLE IF NOT EXISTS {self.states_table} (code BLOB PRIMARY KEY) WITHOUT ROWID')
+        self.connection.execute(f'CREATE TABLE IF NOT EXISTS {self.transitions_table} (from_code BLOB, action TEXT, '
+                                'to_code BLOB, PRIMARY KEY (from_code, action)) WITHOUT ROWID')
+
+    def key(self, state):
+        code = state if isinstance(state, int) else self.encoder.encode(state)
+        return code.to_bytes(self.state_bytes, 'big')
+
+    def state(self, key):
+        code = int.from_bytes(key, 'big')
+        return code if self.compact else self.encoder.decode(code)
+
+    def scan(self, query, batch=BATCH_SIZE):
+        """Runs a keyset-paginated SELECT (query takes the last key and a limit) so large
+        tables are streamed without keeping a cursor open across writes."""
+        last = b''
+        while True:
+            rows = self.connection.execute(query, (last, batch)).fetchall()
+            yield from rows
+            if len(rows) < batch:
+                return
+            last = rows[-1][0]
+
+    def states(self):
+        """Every stored state, in code order."""
+        for (key,) in self.scan(f'SELECT code FROM {self.states_table} WHERE code > ? ORDER BY code LIMIT ?'):
+            yield self.state(key)
+
+    def codes(self):
+        """Every stored state as a packed code, in code order."""
+        for (key,) in self.scan(f'SELECT code FROM {self.states_table} WHERE code > ? ORDER BY code LIMIT ?'):
+            yield int.from_bytes(key, 'big')
+
+    def reencode(self, encoder):
+        """Continues with a new encoder (e.g. after adding a module) and empty tables. The current tables
+        are renamed and returned as a DiskStore over the same file to convert from, drop() it afterwards."""
+        self.connection.commit()
+        old_suffix = f'{self.suffix}_old'
+        for table in (self.states_table, self.transitions_table):
+            self.connection.execute(f'DROP TABLE IF EXISTS {table}_old')
+            self.connection.execute(f'ALTER TABLE {table} RENAME TO {table}_old')
+        old = DiskStore(self.path, self.encoder, self.compact, connection=self.connection, suffix=old_suffix)
+        self.encoder = encoder
+        self.state_bytes = max(1, -(-encoder.num_slots * encoder.slot_bits // 8))
+        self._create_tables()
+        return old
+
+    def drop(self):
+        for table in (self.states_table, self.transitions_table):
+            self.connection.execute(f'DROP TABLE IF EXISTS {table}')
+        self.connection.commit()
+
+    def export_store(self, filename, symmetry_reduced=False):
+        """Writes the binary transition store (see transitionStore.py) from the tables in code order
+        and in batches, without holding the transition relation in memory."""
+        connection = self.connection
+        num_states = connection.execute(f'SELECT COUNT(*) FROM {self.states_table}').fetchone()[0]
+        num_edges = connection.execute(f'SELECT COUNT(*) FROM {self.transitions_table}').fetchone()[0]
+        action_names = [action for (action,) in connection.execute(
+            f'SELECT DISTINCT action FROM {self.transitions_table} ORDER BY action')]
+        action_index = {action: idx for idx, action in enumerate(action_names)}
+
+        # Position of every state in code order, which is its index in the store
+        connection.execute('DROP TABLE IF EXISTS temp.state_index')
+        connection.execute('CREATE TEMP TABLE state_index (code BLOB PRIMARY KEY, idx INTEGER) WITHOUT ROWID')
+        connection.execute(f'INSERT INTO temp.state_index SELECT code, ROW_NUMBER() OVER (ORDER BY code) - 1 '
+                           f'FROM {self.states_table}')
+
+        def batches(query):
+            cursor = connection.execute(query)
+            while True:
+                rows = cursor.fetchmany(BATCH_SIZE)
+                if not rows:
+                    return
+                yield rows
+
+        edges = (f'SELECT target.idx, t.action FROM {self.transitions_table} t '
+                 f'JOIN temp.state_index target ON target.code = t.to_code ORDER BY t.from_code, t.action')
+
+        def sections(name):
+            if name == 'states':
+                for rows in batches(f'SELECT code FROM {self.states_table} ORDER BY code'):
+                    yield np.frombuffer(b''.join(key for (key,) in rows), dtype=np.uint8).reshape(len(rows), self.state_bytes)
+            elif name == 'indptr':
+                yield np.zeros(1, dtype=np.int64)
+                total = 0
+                for rows in batches(f'SELECT COUNT(t.from_code) FROM {self.states_table} s LEFT JOIN '
+                                    f'{self.transitions_table} t ON t.from_code = s.code GROUP BY s.code ORDER BY s.code'):
+                    offsets = total + np.cumsum([count for (count,) in rows], dtype=np.int64)
+                    total = int(offsets[-1])
+                    yield offsets
+            elif name == 'indices':
+                for rows in batches(edges):
+                    yield np.array([target for target, _ in rows], dtype=np.uint32)
+            elif name == 'edge_actions':
+                for rows in batches(edges):
+                    yield np.array([action_index[action] for _, action in rows], dtype=np.uint32)
+
+        try:
+            return stream_transition_store(filename, self.encoder, num_states, action_names, num_edges,
+                                           sections, symmetry_reduced)
+        finally:
+            connection.execute('DROP TABLE temp.state_index')
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
+        if self.temporary and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class DiskStateSet:
+    def __init__(self, store, cache_size=100000, filter_bits=1 << 26):
+        self.store = store
+        self.cache_size = cache_size
+        self.cache = OrderedDict()  # key -> known membership, most recently used last
+        self.count = store.connection.execute(f'SELECT COUNT(*) FROM {store.states_table}').fetchone()[0]
+
+        self.filter_bits = filter_bits
+        self.filter = bytearray(filter_bits // 8)
+        for key in self._keys():
+            self._filter_add(key)
+
+    def _filter_positions(self, key):
+        h = hash(key)
+        h1, h2 = h & 0xFFFFFFFF, (h >> 32) | 1
+        return [(h1 + i * h2) % self.filter_bits for i in range(FILTER_HASHES)]
+
+    def _filter_add(self, key):
+        for bit in self._filter_positions(key):
+            self.filter[bit >> 3] |= 1 << (bit & 7)
+
+    def _filter_may_contain(self, key):
+        return all(self.filter[bit >> 3] & (1 << (bit & 7)) for bit in self._filter_positions(key))
+
+    def _keys(self):
+        for (key,) in self.store.scan(f'SELECT code FROM {self.store.states_table} WHERE code > ? ORDER BY code LIMIT ?'):
+            yield key
+
+    def _remember(self, key, present):
+        self.cache[key] = present
+        self.cache.move_to_end(key)
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    def add(self, state):
+        key = self.store.key(state)
+        if self.cache.get(key):
+            self.cache.move_to_end(key)
+            return
+        cursor = self.store.connection.execute(f'INSERT OR IGNORE INTO {self.store.states_table} VALUES (?)', (key,))
+        self.count += cursor.rowcount
+        self._filter_add(key)
+        self._remember(key, True)
+
+    def discard(self, state):
+        key = self.store.key(state)
+        cursor = self.store.connection.execute(f'DELETE FROM {self.store.states_table} WHERE code = ?', (key,))
+        self.count -= cursor.rowcount
+        self._remember(key, False)
+
+    def __contains__(self, state):
+        try:
+            key = self.store.key(state)
+        except ValueError:
+            return False    # Not representable, so never added
+        present = self.cache.get(key)
+        if present is not None:
+            self.cache.move_to_end(key)
+            return present
+        if not self._filter_may_contain(key):
+            return False
+        present = self.store.connection.execute(f'SELECT 1 FROM {self.store.states_table} WHERE code = ?',
+                                                (key,)).fetchone() is not None
+        self._remember(key, present)
+        return present
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        return self.store.states()
+
+
+class DiskTransitionMap:
+    """{(from_state, action): to_state} written to disk in batches."""
+    def __init__(self, store):
+        self.store = store
+        self.pending = []
+
+    def flush(self):
+        if self.pending:
+            self.store.connection.executemany(f'INSERT OR REPLACE INTO {self.store.transitions_table} VALUES (?, ?, ?)',
+                                              self.pending)
+            self.store.connection.commit()
+            self.pending = []
+
+    def __setitem__(self, key, to_state):
+        from_state, action = key
+        self.pending.append((self.store.key(from_state), action, self.store.key(to_state)))
+        if len(self.pending) >= BATCH_SIZE:
+            self.flush()
+
+    def _lookup(self, key):
+        self.flush()
+        from_state, action = key
+        try:
+            from_key = self.store.key(from_state)
+        except ValueError:
+            return None
+        row = self.store.connection.execute(f'SELECT to_code FROM {self.store.transitions_table} '
+                                            'WHERE from_code = ? AND action = ?', (from_key, action)).fetchone()
+        return row[0] if row is not None else None
+
+    def __getitem__(self, key):
+        to_key = self._lookup(key)
+        if to_key is None:
+            raise KeyError(key)
+        return self.store.state(to_key)
+
+    def __contains__(self, key):
+        return self._lookup(key) is not None
+
+    def get(self, key, default=None):
+        to_key = self._lookup(key)
+        return self.store.state(to_key) if to_key is not None else default
+
+    def __len__(self):
+        self.flush()
+        return self.store.connection.execute(f'SELECT COUNT(*) FROM {self.store.transitions_table}').fetchone()[0]
+
+    def items(self):
+        self.flush()
+        connection = self.store.connection
+        table = self.store.transitions_table
+        last = None
+        while True:
+            if last is None:
+                rows = connection.execute(f'SELECT from_code, action, to_code FROM {table} '
+                                          'ORDER BY from_code, action LIMIT ?', (BATCH_SIZE,)).fetchall()
+            else:
+                rows = connection.execute(f'SELECT from_code, action, to_code FROM {table} '
+                                          'WHERE (from_code, action) > (?, ?) ORDER BY from_code, action LIMIT ?',
+                                          (*last, BATCH_SIZE)).fetchall()
+            for from_key, action, to_key in rows:
+                yield (self.store.state(from_key), action), self.store.state(to_key)
+            if len(rows) < BATCH_SIZE:
+                return
+            last = rows[-1][:2]
+
+    def __iter__(self):
+        for key, _ in self.items():
+            yield key
@@ -0,0 +1,166 @@
+# Closed-loop plan execution with replanning.
+#
+# Instead of following a fixed list of states, every step is looked up in the
+# goal tree of the desired state (see ModelChecker.goal_tree / PlanCache): the
+# tree holds the next action toward the goal for every state that can reach
+# it, so when the hardware ends up somewhere else (misconnection, dropped
+# actuator) the plan from the observed state is a lookup, not a new search.
+# The tree is only recomputed if the observed state is not in it. Each step
+# waits at most step_timeout seconds for the expected state.
+#
+# With makespan=True steps come from ModelChecker.makespan_plan instead: each
+# step is a group of actions on disjoint ports sent as one command matrix. The
+# rounds are cached per goal (PlanCache.makespan_step), so a deviation onto an
+# earlier plan needs no search and a new plan is bounded by the goal tree.
+# With action_costs a round costs its slowest action and the plans minimize the
+# expected wall-clock time instead of the number of rounds.
+
+import time
+
+from planCache import PlanCache
+
+
+class StepTimeout(Exception):
+    pass
+
+
+class PlanExecutor:
+    def __init__(self, transitions, desired_state, read_matrix, matrix_to_state, send_actions,
+                 plan_cache=None, symmetry=None, system_hash=None, step_timeout=30.0, poll_interval=1.0,
+                 max_retries=3, on_matrix=None, makespan=False, max_group=None, encoder=None, action_costs=None):
+        self.transitions = transitions          # {state: [(action, state)]} or a TransitionFunction
+        self.desired_state = desired_state
+        self.read_matrix = read_matrix          # () -> configuration matrix from the control module
+        self.matrix_to_state = matrix_to_state  # e.g. DFA.matrix_to_state
+        self.send_actions = send_actions        # [action] -> None, e.g. sendCommands.write_actions_matrix
+        self.plan_cache = plan_cache if plan_cache is not None else PlanCache()
+        self.symmetry = symmetry
+        self.system_hash = system_hash
+        self.step_timeout = step_timeout
+        self.poll_interval = poll_interval
+        self.max_retries = max_retries          # Failed steps (timeouts or deviations) allowed in a row
+        self.on_matrix = on_matrix              # Called with every matrix read, e.g. TimePlot.plotData
+        self.makespan = makespan                # Send groups of concurrent actions, fewest rounds (or seconds) first
+        self.max_group = max_group
+        self.encoder = encoder                  # Needed by makespan plans over packed integer states
+        self.action_costs = action_costs        # ActionCosts: plan by expected duration and learn from the steps timed here
+        self.tree = None
+        self.log = []                           # (actions, expected state, observed state, outcome, seconds) per step
+
+    def observe(self):
+        matrix = self.read_matrix()
+        if matrix is None:
+            return None     # No frame arrived in time
+        if self.on_matrix is not None:
+            self.on_matrix(matrix)
+        return self.matrix_to_state(matrix)
+
+    def goal_tree(self, state):
+        # Cached per goal, only rebuilt when the observed state was not explored yet
+        if self.tree is None or state not in self.tree:
+            self.tree = self.plan_cache.goal_tree(self.transitions, self.desired_state, {state},
+                                                  self.symmetry, self.system_hash, self.action_costs)
+        return self.tree
+
+    def next_step(self, state):
+        """([actions], expected state) to send from state, or None if the goal cannot be reached from it."""
+        if self.makespan:
+            return self.next_group(state)
+        tree = self.goal_tree(state)
+        if state not in tree:
+            return None
+        action, expected, _ = tree[state]
+        return [action], expected
+
+    def next_group(self, state):
+        return self.plan_cache.makespan_step(self.transitions, state, self.desired_state, self.symmetry,
+                                             self.system_hash, self.action_costs, self.max_group, self.encoder)
+
+    def is_partial(self, previous, expected, state):
+        # Part of a group done: every connection is either unchanged or already as expected
+        if isinstance(state, int):
+            if self.encoder is None:
+                return False
+            previous, expected, state = (self.encoder.decode(code) for code in (previous, expected, state))
+        return previous & expected <= state <= previous | expected
+
+    def wait_for(self, previous, expected, concurrent=False):
+        """Polls until the expected state is read or the state settles somewhere else.
+        Raises StepTimeout if neither happens within step_timeout."""
+        deadline = time.monotonic() + self.step_timeout
+        while True:
+            state = self.observe()
+            if self.settled(previous, expected, state, concurrent):
+                return state
+            if time.monotonic() >= deadline:
+                raise StepTimeout(f"Expected {expected} within {self.step_timeout}s, still reading {state}")
+            time.sleep(self.poll_interval)
+
+    def settled(self, previous, expected, state, concurrent=False):
+        """True if a step is over: the expected state or some other state of the system was read.
+        Readings outside the transition system, or a group of actions that is only partly done,
+        are taken as the hardware still moving."""
+        if state == expected:
+            return True
+        return (state is not None and state != previous and self.is_known(state)
+                and not (concurrent and self.is_partial(previous, expected, state)))
+
+    def record_step(self, actions, expected, observed, seconds):
+        """Logs a finished step, returns True if it reached the expected state."""
+        if observed == expected:
+            self.log.append((actions, expected, observed, 'ok', seconds))
+            if self.action_costs is not None:
+                self.action_costs.record_log(self.log[-1:])
+            return True
+        # Deviation: the next lookup in the goal tree replans from the observed state
+        print(f"Deviation after {actions}: expected {expected}, observed {observed}. Replanning.")
+        self.log.append((actions, expected, observed, 'deviation', seconds))
+        return False
+
+    def is_known(self, state):
+        if callable(self.transitions) or self.symmetry is not None:
+            return True
+        return state in self.transitions or (self.tree is not None and state in self.tree)
+
+    def run(self, state=None):
+        """Drives the hardware to the desired state. Returns True once it is read back, False if the
+        goal is unreachable from the observed state or max_retries steps in a row failed."""
+        if state is None:
+            state = self.observe()
+        failures = 0
+        while state != self.desired_state:
+            if state is None:
+                print("No configuration matrix received from the control module")
+                failures += 1
+                if failures > self.max_retries:
+                    return False
+                state = self.observe()
+                continue
+
+            step = self.next_step(state)
+            if step is None:
+                print(f"The desired state {self.desired_state} is not reachable from the observed state {state}")
+                return False
+            actions, expected = step
+
+            started = time.monotonic()
+            self.send_actions(actions)
+            try:
+                observed = self.wait_for(state, expected, concurrent=len(actions) > 1)
+            except StepTimeout as e:
+                print(f"Step {actions} failed: {e}")
+                self.log.append((actions, expected, state, 'timeout', time.monotonic() - started))
+                failures += 1
+                if failures > self.max_retries:
+                    return False
+                state = self.observe()
+                continue
+
+            if self.record_step(actions, expected, observed, time.monotonic() - started):
+                failures = 0
+            else:
+                failures += 1
+                if failures > self.max_retries:
+                    return False
+            state = observed
+        return True
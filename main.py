@@ -1,19 +1,39 @@
+import asyncio
 import csv
 from send_commands import sendCommands
-from modelChecker import run_model_checker
+from modelChecker import load_transitions, run_model_checker
+from planCache import PlanCache
+from executor import PlanExecutor
+from asyncRuntime import AsyncPlanRunner
+from actionCosts import ActionCosts
 from visualizer import ModularVisualizer
 from ContinuousTimePlot import TimePlot
-from readMatrix import read_matrix_from_serial
+from serialConnection import get_connection
+from changeDetector import ChangeDetector, log_changes
+from transitionStore import TransitionStore, is_transition_store
+from matrixDecoding import matrix_diff, matrix_to_state
+import os
 import time
 
 class DFA:
-    def __init__(self, start_state = frozenset()):
+    def __init__(self, start_state = frozenset(), encoder = None, symmetry = None):
+        self.encoder = encoder      # StateEncoder when transitions.csv holds packed integer states
+        self.symmetry = symmetry    # ModuleSymmetry when transitions.csv only holds representatives
+        if encoder is not None and not isinstance(start_state, int):
+            start_state = encoder.encode(start_state)
         self.current_state = start_state
         self.transitions = {}
-        self.occupied = {}
+        self.last_matrix = None     # Matrix the last action_config_matrix call ended in
 
-    def import_transitions(self, filename='transitions.csv'):
-        self.transitions.clear()
+    def import_transitions(self, filename='transitions.bin'):
+        self.transitions = {}
+
+        if is_transition_store(filename):
+            # Looked up in the memory-mapped store, not copied into a dict
+            store = TransitionStore(filename)
+            self.transitions = store.transition_table(compact=self.encoder is not None)
+            print(f"Transitions imported from {filename}")
+            return
 
         with open(filename, mode='r') as file:
             reader = csv.reader(file)
@@ -35,6 +55,18 @@ class DFA:
         if self.current_state is None:
             raise ValueError("Start state is not set.")
         
+        if self.symmetry is not None:
+            # Look the action up on the representative, then apply it to the concrete state
+            rep, perm = self.symmetry.canonicalize(self.current_state)
+            rep_action = self.symmetry.relabel_action(action, self.symmetry.inverse(perm))
+            if (rep, rep_action) in self.transitions:
+                new_state = self.symmetry.apply_action(self.current_state, action)
+                print(f"Transitioning from {self.current_state} to {new_state} on action '{action}'")
+                self.current_state = new_state
+            else:
+                print(f"No valid transition from state '{self.current_state}' on action '{action}'")
+            return
+
         if (self.current_state, action) in self.transitions:
             new_state = self.transitions[(self.current_state, action)]
             print(f"Transitioning from {self.current_state} to {new_state} on action '{action}'")
@@ -46,59 +78,14 @@ class DFA:
             print(f"No valid transition from state '{self.current_state}' on action '{action}'")
 
     def matrix_to_state(self, matrix):
-        read_state = {}
-        for module_idx, row in enumerate(matrix):
-            for port_idx, val in enumerate(row):
-
-                # 1 indicates the presence of the control module
-                if val == 1:
-                    read_state[f'M{module_idx+1}_P{port_idx+1}'] = f'M0_P0_O1'
-
-                elif val != 0:
-                    if val < 0:     #If value is negative, switch orientation
-                        val = -val
-                        orient = 2
-                    else:
-                        orient = 1
-
-                     # Decodes actuator number and port number
-                    binary_val = format(val, '08b')
-                    port_num = int(binary_val[-3:], 2)
-                    module_num = int(binary_val[:5], 2)
-
-                    read_state[f'M{module_idx+1}_P{port_idx+1}'] = f'M{module_num}_P{port_num}_O{orient}'
-
-        return frozenset(read_state.items())
+        if self.encoder is not None:
+            return self.encoder.encode_matrix(matrix)
+        return matrix_to_state(matrix)     # Table lookup per cell, see matrixDecoding.py
 
     def action_config_matrix(self, matrix):
-        actions = []
-        for module_idx, row in enumerate(matrix):
-            for port_idx, val in enumerate(row):
-                occupied_key = (module_idx, port_idx)
-
-                # 1 indicates the presence of the control module
-                if val == 1:
-                    if occupied_key not in self.occupied:
-                        self.occupied[occupied_key] = True
-                        actions.append(f'connect_M{module_idx+1}_P{port_idx+1}_M0_P0_O1')
-
-                # Non-zero indicates an actuator is connected on that port
-                elif val != 0:
-                    if occupied_key not in self.occupied:
-                        self.occupied[occupied_key] = True
-
-                        # Decodes actuator number and port number
-                        binary_val = format(val, '08b')
-                        port_num = int(binary_val[-3:], 2)
-                        module_num = int(binary_val[:5], 2)
-
-                        actions.append(f'connect_M{module_idx+1}_P{port_idx+1}_M{module_num}_P{port_num}_O1')
-                        print(f'M{module_idx+1}_P{port_idx+1}_M{module_num}_P{port_num}')
-                else: 
-                    # If status of port changes (from a value to zero), disconnect actuator 
-                    if occupied_key in self.occupied:
-                        actions.append(f'disconnect_M{module_idx+1}_P{port_idx+1}')
-                        self.occupied.pop(occupied_key)
+        # Actions between the last matrix read and this one
+        actions = matrix_diff(self.last_matrix, matrix)
+        self.last_matrix = matrix
 
         print(actions)
         for action in actions:
@@ -112,7 +99,12 @@ if __name__ == "__main__":
     plot = TimePlot()
 
     serial_port = '/dev/cu.usbmodem14401'
-    command = sendCommands(modules=5, port=serial_port, baudrate=9600)
+    connection = get_connection(serial_port, 9600)     # Opened once, shared by reads and command writes
+    # Consumers only see a matrix once it was read in 2 frames in a row and differs from the last one
+    detector = ChangeDetector(debounce=2)
+    connection.subscribe(detector.feed)
+    detector.subscribe(log_changes)
+    command = sendCommands(modules=5, serial_port=serial_port, baud_rate=9600, connection=connection)
 
     initial_matrix = [[0, 1, 0],        # Could be read from control module
                     [0,  0, 0],  
@@ -127,28 +119,34 @@ if __name__ == "__main__":
     desired_state = dfa.matrix_to_state(desired_matrix)
     initial_state = dfa.matrix_to_state(initial_matrix)
 
-    verified, states, actions = run_model_checker(dfa.transitions, initial_state, desired_state)
-
-
-    for idx, action in enumerate(actions):      # Iterates over all actions defined by model checker
-        commandSent = False
-
-        while True:     # Waits for action to be completed
-            matrix = read_matrix_from_serial(port=serial_port, baudrate=9600)  ## Reads current Matrix
-            current_state = dfa.matrix_to_state(matrix)    #Converts matrix to a state
-
-            if commandSent == False:    # Only send command to control module once
-                time.sleep(.5)
-                command.write_actions_matrix(action)    # Sends "command matrix"
-                commandSent = True
-               
-            plot.plotData(matrix)      ## Plots data read on ports from matrix over time
-            time.sleep(1)
+    # The model checker works on {state: [(action, state)]} rather than the DFA's (state, action) table
+    transitions = load_transitions('transitions.bin', compact=dfa.encoder is not None)
+    plan_cache = PlanCache(path='plan_cache.pkl')   # Goal trees from earlier runs toward the same targets
+    # Expected action durations, configured and learned from earlier runs, so plans minimize wall-clock time
+    action_costs = ActionCosts.load('action_costs.json') if os.path.exists('action_costs.json') else ActionCosts()
+    verified, states, actions, unreachable_from = run_model_checker(transitions, {initial_state}, desired_state,
+                                                                    plan_cache=plan_cache, action_costs=action_costs)
+    plan_cache.save()
+    if not verified:
+        print(f"Warning: {len(unreachable_from)} reachable states cannot return to the desired state")
+
+
+    # Executes the plan, replanning whenever the observed state deviates from it
+    executor = PlanExecutor(transitions, desired_state,
+                            read_matrix=lambda: detector.read_matrix(timeout=5.0),
+                            matrix_to_state=dfa.matrix_to_state,
+                            send_actions=command.write_actions_matrix,
+                            plan_cache=plan_cache, step_timeout=30.0, on_matrix=plot.plotData,
+                            makespan=True, max_group=2,          # Independent actions go out in one matrix, two at a time
+                            encoder=dfa.encoder,
+                            action_costs=action_costs)            # Step durations are recorded for next time
+    # Decoding, sending and plotting run as separate asyncio tasks, steps advance on the first matching change
+    if not asyncio.run(AsyncPlanRunner(executor, connection, detector=detector).run(initial_state)):
+        print("Execution stopped before the desired state was reached")
+    action_costs.save('action_costs.json')
 
-            if current_state == states[idx]:   # Continue to next action once state has been reached
-                break
-            
     plot.export_data()         ## Once complete, export the readData vs time csv
+    connection.close()
 
         
        
\ No newline at end of file
@@ -0,0 +1,98 @@
+# Table-driven decoding of configuration matrices.
+#
+# Every matrix entry is a signed byte (see matrixProtocol.py), so all 256
+# possible values are decoded once into lookup tables (stateEncoding.CELL_CODES
+# and the connector names below) instead of formatting each cell as a binary
+# string on every poll. Whole matrices, or stacks of matrices from a recorded
+# log, are decoded with one NumPy table lookup.
+
+import numpy as np
+
+from stateEncoding import CELL_CODES, FEMALE_PORTS
+
+CELL_CODE_ARRAY = np.array(CELL_CODES, dtype=np.int64)
+
+
+def _male_name(code):
+    if code == 0:
+        return None
+    male, orient = (code - 1) >> 1, ((code - 1) & 1) + 1
+    return f'M{male >> 3}_P{male & 0x07}_O{orient}'
+
+
+# Male connector name ('M2_P4_O1', 'M0_P0_O1' for the control module) per signed byte, None for 0
+MALE_NAMES = [_male_name(code) for code in CELL_CODES]
+
+
+def male_name(val):
+    return MALE_NAMES[val & 0xFF]
+
+
+def matrix_to_state(matrix):
+    """Frozenset state of one configuration matrix."""
+    return frozenset((f'M{module_idx+1}_P{port_idx+1}', MALE_NAMES[val & 0xFF])
+                     for module_idx, row in enumerate(matrix)
+                     for port_idx, val in enumerate(row) if val != 0)
+
+
+def decode_matrices(matrices):
+    """Slot values (0 for a free port, see stateEncoding) of a matrix or a stack of matrices,
+    same shape as the input."""
+    return CELL_CODE_ARRAY[np.asarray(matrices, dtype=np.int64) & 0xFF]
+
+
+def matrices_to_states(matrices):
+    """Frozenset states of a stack of matrices (shape [frames, modules, ports])."""
+    values = np.asarray(matrices, dtype=np.int64)
+    frames, modules, ports = np.nonzero(values)
+    names = [MALE_NAMES[val] for val in (values[frames, modules, ports] & 0xFF).tolist()]
+    items = [[] for _ in range(len(values))]
+    for frame, module_idx, port_idx, name in zip(frames.tolist(), modules.tolist(), ports.tolist(), names):
+        items[frame].append((f'M{module_idx+1}_P{port_idx+1}', name))
+    return [frozenset(state) for state in items]
+
+
+def matrices_to_codes(matrices, encoder):
+    """Packed integer states (StateEncoder.encode_matrix) of a stack of matrices."""
+    values = decode_matrices(matrices)
+    frames, rows, cols = values.shape
+    occupied = values != 0
+    if (occupied[:, encoder.num_modules:, :].any() or occupied[:, :, len(FEMALE_PORTS):].any()
+            or ((values - 1) >> 4)[occupied].max(initial=0) > encoder.num_modules):
+        raise ValueError(f"Matrices cannot be encoded for {encoder.num_modules} modules")
+
+    rows, cols = min(rows, encoder.num_modules), min(cols, len(FEMALE_PORTS))
+    codes = np.zeros(frames, dtype=object)
+    for module_idx in range(rows):
+        for port_idx in range(cols):
+            shift = (module_idx * len(FEMALE_PORTS) + port_idx) * encoder.slot_bits
+            codes += values[:, module_idx, port_idx].astype(object) << shift
+    return [int(code) for code in codes]
+
+
+def _cell(matrix, module_idx, port_idx):
+    # Cells outside a matrix (or of None) are free ports
+    if matrix is None or module_idx >= len(matrix) or port_idx >= len(matrix[module_idx]):
+        return 0
+    return matrix[module_idx][port_idx]
+
+
+def matrix_diff(old, new):
+    """Actions that turn the configuration read as old into new (old may be None for an empty
+    matrix, cells missing from either matrix count as free ports): disconnects first, then connects
+    to the control module, then the other connects."""
+    disconnects, control_connects, connects = [], [], []
+    rows = max(len(new), len(old) if old is not None else 0)
+    for module_idx in range(rows):
+        cols = max(len(matrix[module_idx]) for matrix in (old, new) if matrix is not None and module_idx < len(matrix))
+        for port_idx in range(cols):
+            previous, val = _cell(old, module_idx, port_idx), _cell(new, module_idx, port_idx)
+            if val == previous:
+                continue
+            female = f'M{module_idx+1}_P{port_idx+1}'
+            if previous != 0:
+                disconnects.append(f'disconnect_{female}')
+            if val != 0:
+                male = MALE_NAMES[val & 0xFF]
+                (control_connects if male.startswith('M0_') else connects).append(f'connect_{female}_{male}')
+    return disconnects + control_connects + connects
@@ -0,0 +1,93 @@
+# Binary frames for the configuration matrix (see send_matrix() in ControlModule.ino).
+#
+#   offset  size  field
+#   0       2     sync marker 0xA5 0x5A
+#   2       1     sequence number, wraps at 256
+#   3       1     rows (actuators)
+#   4       1     cols (ports per actuator)
+#   5       r*c   one signed byte per port, row by row
+#   5+r*c   2     CRC-16/CCITT-FALSE over bytes 2..5+r*c, big-endian
+#
+# A 5x3 matrix is 22 bytes instead of 35-50 bytes of ASCII. The decoder scans
+# for the sync marker, so debug prints and partial frames in the stream are
+# skipped: a frame with a bad CRC or impossible dimensions only discards its
+# first sync byte and the scan continues right after it.
+
+SYNC = b'\xa5\x5a'
+HEADER_SIZE = 5
+CRC_SIZE = 2
+MAX_DIMENSION = 32      # Larger dimensions are treated as garbage
+
+
+def _crc_table():
+    table = []
+    for byte in range(256):
+        crc = byte << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x1021) if crc & 0x8000 else crc << 1
+        table.append(crc & 0xFFFF)
+    return table
+
+_CRC_TABLE = _crc_table()
+
+
+def crc16(data, crc=0xFFFF):
+    for byte in data:
+        crc = ((crc << 8) & 0xFFFF) ^ _CRC_TABLE[(crc >> 8) ^ byte]
+    return crc
+
+
+def encode_frame(matrix, sequence=0):
+    rows, cols = len(matrix), len(matrix[0]) if matrix else 0
+    # FrameDecoder drops anything outside these limits as garbage
+    if not (0 < rows <= MAX_DIMENSION and 0 < cols <= MAX_DIMENSION) or any(len(row) != cols for row in matrix):
+        raise ValueError(f"Matrices have to be rectangular with 1 to {MAX_DIMENSION} rows and columns")
+    if any(not -128 <= value <= 127 for row in matrix for value in row):
+        raise ValueError("Port values have to fit in a signed byte")
+    body = bytes([sequence & 0xFF, rows, cols]) + bytes(value & 0xFF for row in matrix for value in row)
+    return SYNC + body + crc16(body).to_bytes(CRC_SIZE, 'big')
+
+
+class FrameDecoder:
+    def __init__(self):
+        self.buffer = bytearray()
+        self.last_sequence = None
+        self.dropped = 0        # Frames missed according to the sequence numbers
+        self.rejected = 0       # Candidate frames with a bad CRC or dimensions
+
+    def feed(self, data):
+        """Adds received bytes, returns the complete frames in them as [(sequence, matrix)]."""
+        self.buffer.extend(data)
+        frames = []
+        while True:
+            start = self.buffer.find(SYNC)
+            if start < 0:
+                # Keep a trailing first sync byte, its second byte may be in the next read
+                del self.buffer[:len(self.buffer) - 1 if self.buffer.endswith(SYNC[:1]) else len(self.buffer)]
+                return frames
+            del self.buffer[:start]
+            if len(self.buffer) < HEADER_SIZE:
+                return frames
+
+            sequence, rows, cols = self.buffer[2], self.buffer[3], self.buffer[4]
+            if not (0 < rows <= MAX_DIMENSION and 0 < cols <= MAX_DIMENSION):
+                self.rejected += 1
+                del self.buffer[:1]
+                continue
+            size = HEADER_SIZE + rows * cols + CRC_SIZE
+            if len(self.buffer) < size:
+                return frames
+
+            body = bytes(self.buffer[2:size - CRC_SIZE])
+            if crc16(body) != int.from_bytes(self.buffer[size - CRC_SIZE:size], 'big'):
+                self.rejected += 1
+                del self.buffer[:1]
+                continue
+
+            values = [value - 256 if value > 127 else value for value in body[3:]]
+            frames.append((sequence, [values[row * cols:(row + 1) * cols] for row in range(rows)]))
+            del self.buffer[:size]
+
+            if self.last_sequence is not None:
+                self.dropped += (sequence - self.last_sequence - 1) & 0xFF
+            self.last_sequence = sequence
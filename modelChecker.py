@@ -2,8 +2,16 @@
 #This code finds the reachable states of the transition system, then given a state see if it is reachable from all states in the transition system.
 
 import csv
+import heapq
+from concurrent.futures import ProcessPoolExecutor
+from itertools import count
+
+import numpy as np
+
+from csrGraph import CSRGraph
+from transitionStore import StoreSuccessors, TransitionStore, is_transition_store
 from collections import defaultdict, deque
-from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple, Union
 
 State = frozenset
 Action = str
@@ -13,9 +21,58 @@ PropertyFunction = Callable[[State], bool]
 class ModelChecker:
     def __init__(self, 
                  initial_states: Set[State], 
-                 transitions: Dict[State, List[Tuple[Action, State]]]):
+                 transitions: Union[Dict[State, List[Tuple[Action, State]]], TransitionFunction],
+                 symmetry: Optional[Any] = None,
+                 predecessors: Optional[TransitionFunction] = None,
+                 encoder: Optional[Any] = None):
         self.initial_states = initial_states
+        # Either a pre-enumerated dict or a TransitionFunction that expands states on demand
         self.transitions = transitions
+        # With a ModuleSymmetry, transitions only holds representatives and states are translated on expansion
+        self.symmetry = symmetry
+        self._reverse: Optional[Dict[State, List[Tuple[Action, State]]]] = None  # Built by reverse_transitions
+        # Predecessor function for bidirectional search over a TransitionFunction, {state: [(action, predecessor)]}
+        self.predecessors = predecessors
+        self._predecessor_index: Optional[Dict[State, List[Tuple[Action, State]]]] = None
+        # StateEncoder, needed by the A* heuristic for packed integer states
+        self.encoder = encoder if encoder is not None else getattr(symmetry, 'encoder', None)
+        self.nodes_expanded = 0  # States expanded by the last check_reachability call
+        self._graph: Optional[CSRGraph] = None  # Built by csr_graph
+        self._components: Optional[Tuple[List[List[State]], Dict[State, int]]] = None  # Built by strongly_connected_components
+
+    def _successors(self, state: State) -> List[Tuple[Action, State]]:
+        if callable(self.transitions):
+            return self.transitions(state)
+        if self.symmetry is not None:
+            return self.symmetry.successors(state, self.transitions)
+        return self.transitions.get(state, [])
+
+    def _predecessors_of(self, state: State) -> List[Tuple[Action, State]]:
+        if self.predecessors is not None:
+            return self.predecessors(state)
+        if callable(self.transitions):
+            raise ValueError("Bidirectional search over a TransitionFunction needs a predecessors function")
+        if self._predecessor_index is None:
+            # Reverse of the whole table, unlike reverse_transitions this needs no forward search first
+            index: Dict[State, List[Tuple[Action, State]]] = defaultdict(list)
+            for source, edges in self.transitions.items():
+                for action, successor in edges:
+                    if self.symmetry is None:
+                        index[successor].append((action, source))
+                        continue
+                    # A reduced edge ends in some relabeling of the stored representative,
+                    # store it as an edge into the representative itself
+                    _, perm = self.symmetry.canonicalize(self.symmetry.apply_action(source, action))
+                    inverse = self.symmetry.inverse(perm)
+                    index[successor].append((self.symmetry.relabel_action(action, inverse),
+                                             self.symmetry.relabel(source, inverse)))
+            self._predecessor_index = index
+        if self.symmetry is None:
+            return self._predecessor_index.get(state, [])
+        # Reduced table: relabel the representative's incoming edges onto the concrete state
+        rep, perm = self.symmetry.canonicalize(state)
+        return [(self.symmetry.relabel_action(action, perm), self.symmetry.relabel(predecessor, perm))
+                for action, predecessor in self._predecessor_index.get(rep, [])]
 
     def _reconstruct_path(self, 
                           state: State, 
@@ -29,7 +86,26 @@ class ModelChecker:
         path.reverse()
         return path
 
-    def check_reachability(self, desired_state: State) -> Tuple[bool, Optional[List[Tuple[State, Action]]]]:
+    def check_reachability(self, desired_state: State, strategy: str = 'bfs',
+                           cost: Optional[Callable[[Action], float]] = None) -> Tuple[bool, Optional[List[Tuple[State, Action]]]]:
+        """Shortest path from the initial states to the desired state. strategy is 'bfs', 'astar'
+        (port difference heuristic), 'bidirectional', 'frontier' (vectorized BFS over csr_graph) or
+        'dijkstra', which minimizes the summed cost(action) instead of the number of actions (see ActionCosts).
+        The number of states expanded is left in nodes_expanded."""
+        self.nodes_expanded = 0
+        if strategy == 'astar':
+            return self._astar(desired_state)
+        if strategy == 'bidirectional':
+            return self._bidirectional(desired_state)
+        if strategy == 'frontier':
+            return self._frontier(desired_state)
+        if strategy == 'dijkstra':
+            if cost is None:
+                raise ValueError("The dijkstra strategy needs an action cost function")
+            return self._dijkstra(desired_state, cost)
+        if strategy != 'bfs':
+            raise ValueError(f"Unknown search strategy {strategy!r}")
+
         visited: Set[State] = set()
         queue: deque = deque()
         predecessors: Dict[State, Optional[State]] = {}
@@ -51,7 +127,8 @@ class ModelChecker:
                 return True, path
 
             # Expand the current state to its successors
-            for action, successor in self.transitions.get(current_state, []):
+            self.nodes_expanded += 1
+            for action, successor in self._successors(current_state):
                 if successor not in visited:
                     visited.add(successor)
                     queue.append(successor)
@@ -60,7 +137,237 @@ class ModelChecker:
 
         return False, None
 
-    def find_all_reachable_states(self) -> Dict[State, int]:
+    def csr_graph(self) -> CSRGraph:
+        """The transition dict as an integer indexed CSRGraph, built once."""
+        if self._graph is None:
+            if callable(self.transitions) or self.symmetry is not None:
+                raise ValueError("The CSR graph needs a materialized transition dict without symmetry reduction")
+            if isinstance(self.transitions, StoreSuccessors) and all(state in self.transitions for state in self.initial_states):
+                # Wraps the arrays of the store instead of converting the view
+                self._graph = CSRGraph.from_store(self.transitions.store, self.transitions.compact)
+            else:
+                self._graph = CSRGraph.from_checker_transitions(self.transitions, self.initial_states)
+        return self._graph
+
+    def _frontier(self, desired_state: State) -> Tuple[bool, Optional[List[Tuple[State, Action]]]]:
+        graph = self.csr_graph()
+        target = graph.index.get(desired_state)
+        if target is None:
+            return False, None
+        distances, parents, parent_edges, self.nodes_expanded = graph.bfs(
+            [graph.index[state] for state in self.initial_states], target)
+        if distances[target] < 0:
+            return False, None
+        return True, graph.path(parents, parent_edges, target)
+
+    def _dijkstra(self, desired_state: State, cost: Callable[[Action], float]) -> Tuple[bool, Optional[List[Tuple[State, Action]]]]:
+        tiebreak = count()
+        distances: Dict[State, float] = {}
+        predecessors: Dict[State, Optional[State]] = {}
+        actions: Dict[State, Action] = {}
+        heap: List[Tuple[float, int, State]] = []
+        for state in self.initial_states:
+            distances[state] = 0.0
+            predecessors[state] = None
+            heapq.heappush(heap, (0.0, next(tiebreak), state))
+
+        settled: Set[State] = set()
+        while heap:
+            distance, _, current_state = heapq.heappop(heap)
+            if current_state in settled:
+                continue
+            if current_state == desired_state:
+                return True, self._reconstruct_path(current_state, predecessors, actions)
+            settled.add(current_state)
+
+            self.nodes_expanded += 1
+            for action, successor in self._successors(current_state):
+                candidate = distance + cost(action)
+                if successor not in settled and candidate < distances.get(successor, float('inf')):
+                    distances[successor] = candidate
+                    predecessors[successor] = current_state
+                    actions[successor] = action
+                    heapq.heappush(heap, (candidate, next(tiebreak), successor))
+
+        return False, None
+
+    def _astar(self, desired_state: State) -> Tuple[bool, Optional[List[Tuple[State, Action]]]]:
+        # Every action changes one port assignment, so the port difference never overestimates
+        tiebreak = count()
+        cost: Dict[State, int] = {}
+        predecessors: Dict[State, Optional[State]] = {}
+        actions: Dict[State, Action] = {}
+        heap: List[Tuple[int, int, int, State]] = []
+        for state in self.initial_states:
+            cost[state] = 0
+            predecessors[state] = None
+            heapq.heappush(heap, (port_difference(state, desired_state, self.encoder), next(tiebreak), 0, state))
+
+        closed: Set[State] = set()
+        while heap:
+            _, _, distance, current_state = heapq.heappop(heap)
+            if current_state in closed:
+                continue  # Stale entry, a shorter path was found after it was queued
+            if current_state == desired_state:
+                return True, self._reconstruct_path(current_state, predecessors, actions)
+            closed.add(current_state)
+
+            self.nodes_expanded += 1
+            for action, successor in self._successors(current_state):
+                if successor in closed or cost.get(successor, distance + 2) <= distance + 1:
+                    continue
+                cost[successor] = distance + 1
+                predecessors[successor] = current_state
+                actions[successor] = action
+                estimate = distance + 1 + port_difference(successor, desired_state, self.encoder)
+                heapq.heappush(heap, (estimate, next(tiebreak), distance + 1, successor))
+
+        return False, None
+
+    def _bidirectional(self, desired_state: State) -> Tuple[bool, Optional[List[Tuple[State, Action]]]]:
+        # Forward parents {state: (predecessor, action)}, backward parents {state: (action, next_state)}
+        forward: Dict[State, Optional[Tuple[State, Action]]] = {state: None for state in self.initial_states}
+        backward: Dict[State, Optional[Tuple[Action, State]]] = {desired_state: None}
+        if desired_state in forward:
+            return True, [(desired_state, None)]
+        forward_layer, backward_layer = list(forward), [desired_state]
+        forward_depth = {state: 0 for state in forward}
+        backward_depth = {desired_state: 0}
+
+        while forward_layer and backward_layer:
+            # Grow the smaller frontier by one full layer, then keep the shortest meeting point in it
+            expand_forward = len(forward_layer) <= len(backward_layer)
+            next_layer = []
+            meetings = []
+            for current_state in (forward_layer if expand_forward else backward_layer):
+                self.nodes_expanded += 1
+                if expand_forward:
+                    for action, successor in self._successors(current_state):
+                        if successor not in forward:
+                            forward[successor] = (current_state, action)
+                            forward_depth[successor] = forward_depth[current_state] + 1
+                            next_layer.append(successor)
+                            if successor in backward:
+                                meetings.append(successor)
+                else:
+                    for action, predecessor in self._predecessors_of(current_state):
+                        if predecessor not in backward:
+                            backward[predecessor] = (action, current_state)
+                            backward_depth[predecessor] = backward_depth[current_state] + 1
+                            next_layer.append(predecessor)
+                            if predecessor in forward:
+                                meetings.append(predecessor)
+
+            if meetings:
+                meeting = min(meetings, key=lambda state: forward_depth[state] + backward_depth[state])
+                path = []
+                state = meeting
+                while forward[state] is not None:
+                    predecessor, action = forward[state]
+                    path.append((state, action))
+                    state = predecessor
+                path.append((state, None))
+                path.reverse()
+                state = meeting
+                while backward[state] is not None:
+                    action, state = backward[state]
+                    path.append((state, action))
+                return True, path
+
+            if expand_forward:
+                forward_layer = next_layer
+            else:
+                backward_layer = next_layer
+
+        return False, None
+
+    def _touched_ports(self, state: State, successor: State) -> Set[str]:
+        # Female port and male connector (without orientation) of every connection an action adds or removes
+        if isinstance(state, int):
+            if self.encoder is None:
+                raise ValueError("Packed integer states need an encoder to find the ports an action touches")
+            state, successor = self.encoder.decode(state), self.encoder.decode(successor)
+        return {port for female, male in state ^ successor for port in (female, male.rsplit('_', 1)[0])}
+
+    def concurrent_steps(self, state: State, max_group: Optional[int] = None) -> List[Tuple[List[Action], State]]:
+        """Groups of actions on disjoint ports that can be sent together from state, as
+        [([actions], resulting state)]. A group is only kept if every subset of it, applied in
+        any order, stays inside the transition system."""
+        edge_maps: Dict[State, Dict[Action, State]] = {}
+        def edges(current):
+            if current not in edge_maps:
+                edge_maps[current] = dict(self._successors(current))
+            return edge_maps[current]
+
+        actions = list(edges(state).items())
+        touched = [self._touched_ports(state, successor) for _, successor in actions]
+        steps = []
+
+        def extend(group, used, reached, start):
+            # reached holds the state after every subset of group, the full group last
+            for idx in range(start, len(actions)):
+                action = actions[idx][0]
+                if touched[idx] & used:
+                    continue
+                extended = [edges(current).get(action) for current in reached]
+                if None in extended:
+                    continue
+                steps.append((group + [action], extended[-1]))
+                if max_group is None or len(group) + 1 < max_group:
+                    extend(group + [action], used | touched[idx], reached + extended, idx + 1)
+
+        extend([], set(), [state], 0)
+        return steps
+
+    def makespan_plan(self, desired_state: State, max_group: Optional[int] = None,
+                      cost: Optional[Callable[[Action], float]] = None,
+                      heuristic: Optional[Callable[[State], Optional[float]]] = None) -> Tuple[bool, Optional[List[Tuple[State, List[Action]]]]]:
+        """Plan with the fewest rounds, where a round is a group of concurrent actions (see concurrent_steps).
+        With a cost function a round takes as long as its slowest action and the plan minimizes the summed
+        round cost, i.e. the expected wall-clock time (see ActionCosts). heuristic(state) is a consistent lower
+        bound on what is left, None for states that cannot reach the goal (see makespan_heuristic).
+        Returns (reachable, [(state, [actions])]) with an empty group for the initial state."""
+        self.nodes_expanded = 0
+        tiebreak = count()
+        distances: Dict[State, float] = {state: 0 for state in self.initial_states}
+        predecessors: Dict[State, Optional[State]] = {state: None for state in self.initial_states}
+        groups: Dict[State, List[Action]] = {}
+        heap: List[Tuple[float, int, float, State]] = [(0, next(tiebreak), 0, state) for state in self.initial_states]
+        settled: Set[State] = set()
+        while heap:
+            _, _, distance, current_state = heapq.heappop(heap)
+            if current_state in settled:
+                continue
+            if current_state == desired_state:
+                path = []
+                state = current_state
+                while state is not None:
+                    path.append((state, groups.get(state, [])))
+                    state = predecessors[state]
+                path.reverse()
+                return True, path
+
+            settled.add(current_state)
+
+            self.nodes_expanded += 1
+            for group, successor in self.concurrent_steps(current_state, max_group):
+                candidate = distance + (1 if cost is None else max(cost(action) for action in group))
+                if successor not in settled and candidate < distances.get(successor, float('inf')):
+                    estimate = heuristic(successor) if heuristic is not None else 0
+                    if estimate is None:
+                        continue    # Cannot reach the goal
+                    distances[successor] = candidate
+                    predecessors[successor] = current_state
+                    groups[successor] = group
+                    heapq.heappush(heap, (candidate + estimate, next(tiebreak), candidate, successor))
+        return False, None
+
+    def find_all_reachable_states(self, strategy: str = 'bfs') -> Dict[State, int]:
+        if strategy == 'frontier':
+            graph = self.csr_graph()
+            distances = graph.bfs([graph.index[state] for state in self.initial_states])[0]
+            return {graph.states[idx]: int(distances[idx]) for idx in np.flatnonzero(distances >= 0)}
+
         visited: Set[State] = set()
         queue: deque = deque()
         distances: Dict[State, int] = {}  # Store distance to each state
@@ -76,41 +383,268 @@ class ModelChecker:
             current_distance = distances[current_state]
 
             # Expand the current state to its successors
-            for action, successor in self.transitions.get(current_state, []):
+            for action, successor in self._successors(current_state):
                 if successor not in visited:
                     visited.add(successor)
                     queue.append(successor)
                     distances[successor] = current_distance + 1  # Increment distance for successor
 
         return distances
+
+    def reverse_transitions(self, reachable: Optional[Iterable[State]] = None) -> Dict[State, List[Tuple[Action, State]]]:
+        """Predecessors {state: [(action, predecessor)]} over the states reachable from the initial states.
+        Built once and reused by later backward searches. Pass reachable (e.g. the result of
+        find_all_reachable_states) when the reachable states are already known."""
+        if self._reverse is None:
+            reverse: Dict[State, List[Tuple[Action, State]]] = defaultdict(list)
+            if reachable is None:
+                reachable = self.find_all_reachable_states()
+            for state in reachable:
+                reverse[state]  # States without predecessors still get an entry
+                for action, successor in self._successors(state):
+                    reverse[successor].append((action, state))
+            self._reverse = reverse
+        return self._reverse
+
+    def states_that_cannot_reach(self, desired_state: State, reachable: Optional[Iterable[State]] = None) -> Set[State]:
+        """Reachable states from which the desired state is unreachable, using a single
+        backward BFS from the desired state over the reverse transition graph. reachable is
+        passed on to reverse_transitions."""
+        reverse = self.reverse_transitions(reachable)
+        if desired_state not in reverse:
+            return set(reverse)
+
+        can_reach: Set[State] = {desired_state}
+        queue: deque = deque([desired_state])
+        while queue:
+            current_state = queue.popleft()
+            for action, predecessor in reverse[current_state]:
+                if predecessor not in can_reach:
+                    can_reach.add(predecessor)
+                    queue.append(predecessor)
+
+        return set(reverse) - can_reach
+
+    def goal_tree(self, desired_state: State,
+                  cost: Optional[Callable[[Action], float]] = None) -> Dict[State, Tuple[Optional[Action], Optional[State], int]]:
+        """Shortest-path-to-goal tree from a backward BFS: {state: (action, next_state, distance)}
+        for every reachable state that can reach the desired state. The desired state maps to (None, None, 0).
+        With a cost function it is a backward Dijkstra and distance is the summed action cost."""
+        reverse = self.reverse_transitions()
+        tree: Dict[State, Tuple[Optional[Action], Optional[State], int]] = {}
+        if desired_state not in reverse:
+            return tree
+        if cost is not None:
+            return self._weighted_goal_tree(desired_state, cost)
+
+        tree[desired_state] = (None, None, 0)
+        queue: deque = deque([desired_state])
+        while queue:
+            current_state = queue.popleft()
+            distance = tree[current_state][2] + 1
+            for action, predecessor in reverse[current_state]:
+                if predecessor not in tree:
+                    tree[predecessor] = (action, current_state, distance)
+                    queue.append(predecessor)
+        return tree
+
+    def _weighted_goal_tree(self, desired_state: State, cost: Callable[[Action], float]):
+        reverse = self.reverse_transitions()
+        tiebreak = count()
+        tree = {}
+        best: Dict[State, Tuple[float, Optional[Action], Optional[State]]] = {desired_state: (0.0, None, None)}
+        heap = [(0.0, next(tiebreak), desired_state)]
+        while heap:
+            distance, _, current_state = heapq.heappop(heap)
+            if current_state in tree:
+                continue
+            _, action, next_state = best[current_state]
+            tree[current_state] = (action, next_state, distance)
+            for action, predecessor in reverse[current_state]:
+                candidate = distance + cost(action)
+                if predecessor not in tree and candidate < best.get(predecessor, (float('inf'),))[0]:
+                    best[predecessor] = (candidate, action, current_state)
+                    heapq.heappush(heap, (candidate, next(tiebreak), predecessor))
+        return tree
+
+    def strongly_connected_components(self) -> Tuple[List[List[State]], Dict[State, int]]:
+        """SCCs of the states reachable from the initial states (every state of a transition dict if
+        there are none), as (components, component_of). Iterative Tarjan, so deep graphs do not hit the
+        recursion limit. Components come out in reverse topological order: edges only go to lower indices."""
+        if self._components is not None:
+            return self._components
+
+        if self.initial_states or callable(self.transitions):
+            states = list(self.find_all_reachable_states())
+        else:
+            states = list(dict.fromkeys([state for state in self.transitions] +
+                                        [successor for edges in self.transitions.values() for _, successor in edges]))
+
+        index: Dict[State, int] = {}
+        lowlink: Dict[State, int] = {}
+        on_stack: Set[State] = set()
+        stack: List[State] = []
+        components: List[List[State]] = []
+        component_of: Dict[State, int] = {}
+
+        for root in states:
+            if root in index:
+                continue
+            index[root] = lowlink[root] = len(index)
+            stack.append(root)
+            on_stack.add(root)
+            work = [(root, iter(self._successors(root)))]
+            while work:
+                state, edges = work[-1]
+                for _, successor in edges:
+                    if successor not in index:
+                        index[successor] = lowlink[successor] = len(index)
+                        stack.append(successor)
+                        on_stack.add(successor)
+                        work.append((successor, iter(self._successors(successor))))
+                        break
+                    if successor in on_stack:
+                        lowlink[state] = min(lowlink[state], index[successor])
+                else:
+                    # All successors done
+                    work.pop()
+                    if work:
+                        parent = work[-1][0]
+                        lowlink[parent] = min(lowlink[parent], lowlink[state])
+                    if lowlink[state] == index[state]:
+                        component = []
+                        while True:
+                            member = stack.pop()
+                            on_stack.discard(member)
+                            component_of[member] = len(components)
+                            component.append(member)
+                            if member == state:
+                                break
+                        components.append(component)
+
+        self._components = (components, component_of)
+        return self._components
+
+    def condensation(self) -> Dict[int, Set[int]]:
+        """Component DAG {component: {successor components}} of strongly_connected_components."""
+        components, component_of = self.strongly_connected_components()
+        dag: Dict[int, Set[int]] = {}
+        for idx, component in enumerate(components):
+            dag[idx] = {component_of[successor] for state in component
+                        for _, successor in self._successors(state)} - {idx}
+        return dag
+
+    def scc_report(self, goals) -> Dict[str, Any]:
+        """Trap-state analysis for several goals from one SCC decomposition.
+        For each goal: its component, the trap states (reachable states that cannot reach it) and
+        whether it is reachable from everywhere, which holds iff its component is the only sink."""
+        components, component_of = self.strongly_connected_components()
+        dag = self.condensation()
+        sinks = [idx for idx, successors in dag.items() if not successors]
+
+        goal_components: Dict[State, Optional[int]] = {}
+        trap_states: Dict[State, List[State]] = {}
+        universal: Dict[State, bool] = {}
+        for goal in goals:
+            goal_component = component_of.get(goal)
+            goal_components[goal] = goal_component
+            # Successors have lower indices, so one pass in index order settles every component
+            reaches = [False] * len(components)
+            if goal_component is not None:
+                for idx in range(goal_component, len(components)):
+                    reaches[idx] = idx == goal_component or any(reaches[successor] for successor in dag[idx])
+            trap_states[goal] = [state for idx, component in enumerate(components) if not reaches[idx] for state in component]
+            universal[goal] = sinks == [goal_component]
+
+        return {
+            'components': components,
+            'component_of': component_of,
+            'condensation': dag,
+            'sinks': sinks,
+            'goal_components': goal_components,
+            'trap_states': trap_states,
+            'universal': universal,
+        }
+
+def port_difference(state: State, desired_state: State, encoder: Optional[Any] = None) -> int:
+    """Number of female ports whose connection differs between two states (frozensets, or packed ints with an encoder)."""
+    if isinstance(state, int):
+        if encoder is None:
+            raise ValueError("Packed integer states need an encoder for the port difference")
+        diff = state ^ desired_state
+        differing = 0
+        while diff:
+            if diff & encoder.slot_mask:
+                differing += 1
+            diff >>= encoder.slot_bits
+        return differing
+    current, desired = dict(state), dict(desired_state)
+    return sum(1 for port in current.keys() | desired.keys() if current.get(port) != desired.get(port))
+
+def makespan_heuristic(tree, max_group: Optional[int] = None, weighted: bool = False) -> Callable[[State], Optional[float]]:
+    """Lower bound for makespan_plan from a goal tree: a round of at most max_group actions shortens the
+    single-action distance (or with a weighted tree, the summed cost) by at most max_group steps (or times
+    the round cost). None for states outside the tree, which cannot reach the goal."""
+    def estimate(state):
+        entry = tree.get(state)
+        if entry is None:
+            return None
+        if max_group is None:
+            return 0
+        return entry[2] / max_group if weighted else -(-entry[2] // max_group)
+    return estimate
+
+def path_from_goal_tree(tree, initial_states) -> Optional[List[Tuple[State, Action]]]:
+    """Follows a goal tree from the closest initial state, same (state, action) format as check_reachability."""
+    starts = [state for state in initial_states if state in tree]
+    if not starts:
+        return None
+
+    state = min(starts, key=lambda start: tree[start][2])
+    path = [(state, None)]
+    while tree[state][1] is not None:
+        action, state, _ = tree[state]
+        path.append((state, action))
+    return path
     
-def run_model_checker(transitions, initial_states, desired_state, printStat = True):
-
-    # Initialize the model checker
-    checker = ModelChecker(initial_states, transitions)
-
-    # Find all reachable states and their distances from the desired state
-    reachable_set = checker.find_all_reachable_states()
-  
-    # Check reachability of the desired state from the initial states
-    reachable, path_to_desired = checker.check_reachability(desired_state)
-
-    # Now check reachability for each reachable state
-    for state, distance in reachable_set.items():
-        reachable_from_state, path_to_desired = checker.check_reachability(desired_state)
-        if not reachable_from_state:
-            print(f"The desired state {desired_state} is NOT reachable from state {state} ...")
-            exit()
-        
-    verified = True
-     
+def run_model_checker(transitions, initial_states, desired_state, printStat = True, symmetry = None, plan_cache = None, strategy = 'bfs', action_costs = None):
+
+    if plan_cache is not None:
+        # Cached shortest-path-to-goal tree: planning and the universal check are lookups, a cache hit
+        # runs no search. unreachable_from covers the states the cached entry explored, for a
+        # transition dict every state in it
+        tree, unreachable = plan_cache.goal_entry(transitions, desired_state, initial_states, symmetry, cost=action_costs)
+        unreachable_from = set(unreachable)     # Copy, the cached set must not change
+        path_to_desired = path_from_goal_tree(tree, initial_states)
+        reachable = path_to_desired is not None
+        num_states = len(tree) + len(unreachable)
+    else:
+        # Initialize the model checker
+        checker = ModelChecker(initial_states, transitions, symmetry)
+
+        # Find all reachable states once, they are counted and reused by the universal check below
+        reachable_states = checker.find_all_reachable_states()
+        num_states = len(reachable_states)
+
+        # Check reachability of the desired state from the initial states
+        # With action costs the plan minimizes expected duration rather than the number of actions
+        if action_costs is not None:
+            strategy = 'dijkstra'
+        reachable, path_to_desired = checker.check_reachability(desired_state, strategy, action_costs)
+
+        # Now check that the desired state is reachable from every reachable state (one backward search)
+        unreachable_from = checker.states_that_cannot_reach(desired_state, reachable_states)
+    verified = not unreachable_from
+    if not verified:
+        print(f"The desired state {desired_state} is NOT reachable from {len(unreachable_from)} of the {num_states} reachable states.")
 
     state_Path = []
     action_Path = []
     if reachable:
         if printStat == True:
-            print('All states in reach(TS) satisfy the property!')
-            print('There are', len(reachable_set), ' reachable states in the TS from the initial state.')
+            if verified:
+                print('All states in reach(TS) satisfy the property!')
+            print('There are', num_states, ' reachable states in the TS from the initial state.')
             print(f"The desired state {desired_state} is reachable from the initial states.")
             print("Path to desired state (state, action):")
 
@@ -122,10 +656,61 @@ def run_model_checker(transitions, initial_states, desired_state, printStat = Tr
                     print(f"State: {state}, Action: {action}")
     else:
         print(f"The desired state {desired_state} is not reachable from the initial states.")
-        exit()
-
 
-    return verified, state_Path, action_Path 
+    # unreachable_from holds the reachable states that cannot reach the desired state
+    return verified, state_Path, action_Path, unreachable_from
+
+def plan_batch(transitions, pairs, symmetry = None, workers = 1):
+    """Plans for many (initial_states, desired_state) pairs with one backward search per distinct goal.
+    Returns (plans, unreachable_from): plans[i] is (reachable, state_Path, action_Path) for pairs[i] and
+    unreachable_from[goal] holds the states reachable from any of the initial states that cannot reach goal.
+    With workers > 1 the distinct goals are spread over that many processes."""
+    pairs = [(set(initial_states), desired_state) for initial_states, desired_state in pairs]
+    sources = set()
+    goals: Dict[State, List[int]] = {}
+    for idx, (initial_states, desired_state) in enumerate(pairs):
+        sources.update(initial_states)
+        goals.setdefault(desired_state, []).append(idx)
+
+    jobs = [(desired_state, [pairs[idx][0] for idx in members]) for desired_state, members in goals.items()]
+    if workers > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(workers, initializer=_init_batch_worker,
+                                 initargs=(sources, transitions, symmetry)) as pool:
+            results = list(pool.map(_batch_goal, jobs, chunksize=max(1, len(jobs) // (workers * 4))))
+    else:
+        # One checker, so the reverse transition graph is built once for all goals
+        checker = ModelChecker(sources, transitions, symmetry)
+        results = [_plan_goal(checker, job) for job in jobs]
+
+    plans = [None] * len(pairs)
+    unreachable_from = {}
+    for (desired_state, members), (goal_plans, unreachable) in zip(goals.items(), results):
+        unreachable_from[desired_state] = unreachable
+        for idx, plan in zip(members, goal_plans):
+            plans[idx] = plan
+    return plans, unreachable_from
+
+def _plan_goal(checker, job):
+    desired_state, initial_sets = job
+    tree = checker.goal_tree(desired_state)
+    plans = []
+    for initial_states in initial_sets:
+        path = path_from_goal_tree(tree, initial_states)
+        if path is None:
+            plans.append((False, [], []))
+        else:
+            plans.append((True, [state for state, _ in path[1:]], [action for _, action in path[1:]]))
+    unreachable = {state for state in checker.reverse_transitions() if state not in tree}
+    return plans, unreachable
+
+_batch_checker = None
+
+def _init_batch_worker(sources, transitions, symmetry):
+    global _batch_checker
+    _batch_checker = ModelChecker(sources, transitions, symmetry)
+
+def _batch_goal(job):
+    return _plan_goal(_batch_checker, job)
 
 def load_data(file_path):
     """This function loads in the pre-defined state transitions. The file path is passed in main."""
@@ -149,18 +734,29 @@ def load_data(file_path):
 
     return from_states, actions, to_states
 
+def load_transitions(file_path, compact=False):
+    """Loads the transition relation as {state: [(action, state)]} from the binary store or a CSV export.
+    A store is not copied, the result is a read-only view that decodes the states it is asked for."""
+    if is_transition_store(file_path):
+        return TransitionStore(file_path).checker_transitions(compact)
+
+    transitions = defaultdict(list)
+    for from_state, action, to_state in zip(*load_data(file_path)):
+        from_state, to_state = eval(from_state), eval(to_state)
+        if not isinstance(from_state, int):     # Packed integer exports stay as ints
+            from_state, to_state = frozenset(from_state), frozenset(to_state)
+        transitions[from_state].append((action, to_state))
+    return transitions
+
 # Test
 if __name__ == "__main__":
 
-    csv_file_path = 'transitions.csv'
-    from_states, actions, to_states = load_data(csv_file_path)
-    if 1: #Print number of lines loaded:
-        print(f"Loaded {len(from_states)} transition relations.")
+    file_path = 'transitions.bin'
 
-    # Create transition relation dictionary from transitions.csv
-    transitions = defaultdict(list)
-    for from_state, action, to_state in zip(from_states, actions, to_states):
-        transitions[frozenset(eval(from_state))].append((action, frozenset(eval(to_state))))
+    # Create transition relation dictionary from transitions.bin (or a transitions.csv export)
+    transitions = load_transitions(file_path)
+    if 1: #Print number of lines loaded:
+        print(f"Loaded {sum(len(edges) for edges in transitions.values())} transition relations.")
 
     # Define initial state (I \subseteq S)
     initial_states = {
@@ -175,6 +771,6 @@ if __name__ == "__main__":
     #desired_state = frozenset({('M2_P1', 'M1_P4_O2'), ('M1_P1', 'M0_P0_O1')})#More complex reconifiguration
 
  
-    verified, state_Path, action_Path  = run_model_checker(transitions, initial_states, desired_state, printStat = True)
+    verified, state_Path, action_Path, unreachable_from = run_model_checker(transitions, initial_states, desired_state, printStat = True)
 
 
@@ -0,0 +1,177 @@
+# Goal-rooted plan cache.
+#
+# For a goal configuration a backward BFS gives the shortest-path-to-goal tree
+# of the whole transition system ({state: (action, next_state, distance)}, see
+# ModelChecker.goal_tree). Once it exists a plan from any current state is a
+# pointer chase. Trees are cached per (transition system hash, desired state)
+# with LRU eviction once the total number of stored states exceeds max_states,
+# and can be persisted to disk between runs. The rounds of makespan plans
+# (ModelChecker.makespan_plan) are cached per goal the same way.
+
+import hashlib
+import os
+import pickle
+from collections import OrderedDict
+
+from modelChecker import ModelChecker, makespan_heuristic, path_from_goal_tree
+from transitionStore import StoreSuccessors
+
+CACHE_VERSION = 1
+
+
+def _state_key(state):
+    return str(state) if isinstance(state, int) else str(sorted(state))
+
+
+def transition_system_hash(transitions):
+    """Content hash of a {state: [(action, state)]} transition relation, independent of ordering."""
+    digest = hashlib.sha256()
+    for line in sorted(f'{_state_key(state)}|{action}|{_state_key(successor)}'
+                       for state, edges in transitions.items() for action, successor in edges):
+        digest.update(line.encode())
+        digest.update(b'\n')
+    return digest.hexdigest()
+
+
+class PlanCache:
+    def __init__(self, max_states=1000000, path=None):
+        self.max_states = max_states
+        self.path = path
+        # (system hash, desired state[, cost signature]) -> (tree, unreachable) and
+        # (system hash, desired state, cost signature, 'makespan', max_group) -> ({state: ([actions], expected)}, set())
+        self.entries = OrderedDict()    # Most recent last
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._last_system = None        # (transitions, hash) so the same dict is only hashed once
+
+        if path is not None and os.path.exists(path):
+            self.load(path)
+
+    def _system_hash(self, transitions):
+        if getattr(transitions, 'content_hash', None) is not None:
+            return transitions.content_hash     # Views of a TransitionStore carry the hash of the file
+        if self._last_system is None or self._last_system[0] is not transitions:
+            self._last_system = (transitions, transition_system_hash(transitions))
+        return self._last_system[1]
+
+    def goal_tree(self, transitions, desired_state, initial_states=(), symmetry=None, system_hash=None, cost=None):
+        """Returns the goal tree for desired_state, computing it on a miss. Pass system_hash
+        (e.g. TransitionStore.content_hash) for transition functions or to skip hashing.
+        With an ActionCosts cost the tree minimizes expected duration and is cached per cost table."""
+        return self.goal_entry(transitions, desired_state, initial_states, symmetry, system_hash, cost)[0]
+
+    def goal_entry(self, transitions, desired_state, initial_states=(), symmetry=None, system_hash=None, cost=None):
+        """(goal tree, unreachable) for desired_state, where unreachable holds the explored states that
+        cannot reach it. Same arguments as goal_tree."""
+        system_hash = self._checked_hash(transitions, system_hash)
+        key = (system_hash, desired_state) if cost is None else (system_hash, desired_state, cost.signature())
+
+        entry = self.entries.get(key)
+        if entry is not None and all(state in entry[0] or state in entry[1] for state in initial_states):
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return entry
+
+        # Explore from every state of an in-memory dict. A TransitionFunction or a view of a transition
+        # store is explored from the initial states and the states of the previous entry, listing
+        # every state of a store would decode all of it on each miss
+        self.misses += 1
+        sources = set(initial_states)
+        if not callable(transitions) and not isinstance(transitions, StoreSuccessors):
+            sources.update(transitions)
+        if entry is not None:
+            sources.update(entry[0])
+            sources.update(entry[1])
+            self._evict(key)
+        if cost is not None:
+            # Trees for an earlier cost table are never looked up again
+            for stale in [other for other in self.entries if len(other) >= 3 and other[0] == system_hash
+                          and other[2] is not None and other[2] != key[2]]:
+                self._evict(stale)
+
+        checker = ModelChecker(sources, transitions, symmetry)
+        tree = checker.goal_tree(desired_state, cost)
+        unreachable = set(checker.reverse_transitions()) - set(tree)
+        entry = self.entries[key] = (tree, unreachable)
+        self.size += len(tree) + len(unreachable)
+
+        self._shrink()
+        return entry
+
+    def _checked_hash(self, transitions, system_hash):
+        if system_hash is None:
+            if callable(transitions):
+                raise ValueError("system_hash is required when transitions is a TransitionFunction")
+            system_hash = self._system_hash(transitions)
+        return system_hash
+
+    def makespan_step(self, transitions, state, desired_state, symmetry=None, system_hash=None, cost=None,
+                      max_group=None, encoder=None):
+        """([actions], expected state) of the next round from state in a makespan plan toward desired_state,
+        or None if the goal cannot be reached. Rounds of every plan found are kept, so a deviation onto a
+        state of an earlier plan is a lookup, and the goal tree bounds the search for a new one."""
+        system_hash = self._checked_hash(transitions, system_hash)
+        tree = self.goal_tree(transitions, desired_state, {state}, symmetry, system_hash, cost)
+        key = (system_hash, desired_state, cost.signature() if cost is not None else None, 'makespan', max_group)
+        if key not in self.entries:
+            self.entries[key] = ({}, set())
+        self.entries.move_to_end(key)
+        steps = self.entries[key][0]
+        if state in steps:
+            self.hits += 1
+            return steps[state]
+        if state not in tree:
+            return None
+
+        self.misses += 1
+        checker = ModelChecker({state}, transitions, symmetry, encoder=encoder)
+        reachable, path = checker.makespan_plan(desired_state, max_group, cost,
+                                                makespan_heuristic(tree, max_group, cost is not None))
+        if not reachable:
+            return None
+        for (current, _), (expected, group) in zip(path, path[1:]):
+            if current not in steps:
+                steps[current] = (group, expected)
+                self.size += 1
+        step = steps[state]
+        self._shrink()
+        return step
+
+    def plan(self, transitions, initial_state, desired_state, symmetry=None, system_hash=None, cost=None):
+        """Shortest plan as (reachable, state_Path, action_Path), like run_model_checker."""
+        tree = self.goal_tree(transitions, desired_state, {initial_state}, symmetry, system_hash, cost)
+        path = path_from_goal_tree(tree, {initial_state})
+        if path is None:
+            return False, [], []
+        return True, [state for state, _ in path[1:]], [action for _, action in path[1:]]
+
+    def _shrink(self):
+        while self.size > self.max_states and len(self.entries) > 1:
+            self._evict(next(iter(self.entries)))
+
+    def _evict(self, key):
+        tree, unreachable = self.entries.pop(key)
+        self.size -= len(tree) + len(unreachable)
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+
+    def save(self, path=None):
+        path = path or self.path
+        with open(path, 'wb') as f:
+            pickle.dump({'version': CACHE_VERSION, 'entries': list(self.entries.items())}, f)
+
+    def load(self, path=None):
+        path = path or self.path
+        with open(path, 'rb') as f:
+            data = pickle.load(f)
+        if data.get('version') != CACHE_VERSION:
+            return  # Stale format, start empty
+
+        self.clear()
+        for key, entry in data['entries']:
+            self.entries[key] = entry
+            self.size += len(entry[0]) + len(entry[1])
+        self._shrink()
@@ -0,0 +1,109 @@
+# CTL-style properties over the whole transition system.
+#
+# States are the integer indices of a CSRGraph and state sets are NumPy
+# boolean arrays, so a fixed point iteration is a few array operations per
+# step instead of a Python loop over frozensets. The predecessor image of a
+# set X is taken over the edge list: an edge i -> j puts i in pre(X) if X[j].
+#
+#   graph = CSRGraph.from_store(TransitionStore('transitions.bin'))
+#   checker = PropertyChecker(graph)
+#   checker.AG(no_ring)                         # states from which no ring is ever formed
+#   checker.holds(checker.EF(control_on('P1')), initial_states)
+#
+# Operands are boolean arrays, predicates on frozenset states or collections
+# of states. States without successors are treated as dead ends: they satisfy
+# EX/AX of nothing, so AF only holds there if the operand already holds.
+
+import numpy as np
+
+from csrGraph import CSRGraph
+
+
+# Predicates on frozenset states
+def control_on(port):
+    """The control module is attached to female port P1-P3 of some module."""
+    def predicate(state):
+        return any(male.startswith('M0_') and female.endswith(f'_{port}') for female, male in state)
+    return predicate
+
+
+def is_ring(state):
+    # A tree over k modules has k-1 connections, the ring formation has one more
+    modules = {'M0'}
+    for female, male in state:
+        modules.add(female.split('_')[0])
+        modules.add(male.split('_')[0])
+    return bool(state) and len(state) == len(modules)
+
+
+def no_ring(state):
+    return not is_ring(state)
+
+
+class PropertyChecker:
+    def __init__(self, graph: CSRGraph, encoder=None):
+        self.graph = graph
+        # Packed integer states are decoded before predicates are applied
+        self.encoder = encoder
+        self.degree = graph.out_degree()
+        self.num_states = len(graph)
+
+    def states(self, phi):
+        """Boolean array for phi: a boolean array, a predicate on states or a collection of states."""
+        if isinstance(phi, np.ndarray):
+            return phi.astype(bool, copy=False)
+        if callable(phi):
+            if self.encoder is not None:
+                return self.graph.label(lambda state: phi(self.encoder.decode(state) if isinstance(state, int) else state))
+            return self.graph.label(phi)
+        return self.graph.mask(phi)
+
+    def pre_exists(self, target):
+        """States with at least one successor in target."""
+        result = np.zeros(self.num_states, dtype=bool)
+        result[self.graph.sources[target[self.graph.indices]]] = True
+        return result
+
+    def pre_forall(self, target):
+        """States that have successors and all of them are in target."""
+        hits = np.bincount(self.graph.sources[target[self.graph.indices]], minlength=self.num_states)
+        return (hits == self.degree) & (self.degree > 0)
+
+    def EX(self, phi):
+        return self.pre_exists(self.states(phi))
+
+    def AX(self, phi):
+        return self.pre_forall(self.states(phi))
+
+    def EU(self, phi, psi):
+        """E[phi U psi]: least fixed point Z = psi | (phi & EX Z), grown from the newly added states only."""
+        allowed = self.states(phi)
+        result = self.states(psi).copy()
+        frontier = result
+        while frontier.any():
+            frontier = self.pre_exists(frontier) & allowed & ~result
+            result |= frontier
+        return result
+
+    def EF(self, phi):
+        return self.EU(np.ones(self.num_states, dtype=bool), phi)
+
+    def AG(self, phi):
+        return ~self.EF(~self.states(phi))
+
+    def AF(self, phi):
+        """Least fixed point Z = phi | AX Z."""
+        result = self.states(phi).copy()
+        while True:
+            grown = result | self.pre_forall(result)
+            if np.array_equal(grown, result):
+                return result
+            result = grown
+
+    def holds(self, result, states):
+        """True if every state in states is in the result set."""
+        return all(result[self.graph.index[state]] for state in states)
+
+    def satisfying(self, result):
+        """The states of a result set."""
+        return [self.graph.states[idx] for idx in np.flatnonzero(result)]
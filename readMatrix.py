@@ -1,19 +1,9 @@
-import serial
+from serialConnection import get_connection
 
-def read_matrix_from_serial(port='/dev/cu.usbmodem14401', baudrate=9600, rows=5, cols=4):
-    ser = serial.Serial(port, baudrate)
-    config_matrix = []
-    while True:
-        if ser.in_waiting >= 0:
-            line = ser.readline().decode('utf-8').strip()
-            if line:
-                row = list(map(int, line.split(',')))
-                config_matrix.append(row)
-            
-                if len(config_matrix) == rows:
-                    break
-    return config_matrix
+def read_matrix_from_serial(port='/dev/cu.usbmodem14401', baudrate=9600, rows=5, cols=3, timeout=None, protocol='binary'):
+    # The port stays open between calls, the connection's reader thread parses the frames
+    return get_connection(port, baudrate, rows, cols, protocol).read_matrix(timeout)
 
 if __name__ == '__main__':
     matrix = read_matrix_from_serial()
-    print(matrix)
\ No newline at end of file
+    print(matrix)
@@ -1,11 +1,12 @@
-import serial
+from serialConnection import get_connection
 
 class sendCommands:
-    def __init__(self, modules, serial_port='/dev/cu.usbmodem14401', baud_rate=9600):
+    def __init__(self, modules, serial_port='/dev/cu.usbmodem14401', baud_rate=9600, connection=None):
         self.col = 3
         self.rows = modules
         self.serial_port = serial_port
         self.baud_rate = baud_rate
+        self.connection = connection    # Shared SerialConnection, opened on the first write if not given
 
 
     def actions_to_matrix(self, actions):
@@ -25,14 +26,14 @@ class sendCommands:
         return control_matrix
 
     def write_actions_matrix(self, actions):
+        if self.connection is None:
+            self.connection = get_connection(self.serial_port, self.baud_rate)
         matrix = self.actions_to_matrix(actions)
-        with serial.Serial(self.serial_port, self.baud_rate, timeout=1) as ser:
-            for row in matrix:
-                row_data = ','.join(map(str, row)) + '\n'
-                ser.write(row_data.encode('utf-8'))
-                ser.flush()
-                print(f"Sent: {row_data.strip()}") 
-        ser.write("END\n".encode('utf-8'))
+        lines = [','.join(map(str, row)) for row in matrix]
+        # Rows and END go out in one locked write on the open port
+        self.connection.write_lines(lines + ['END'])
+        for line in lines:
+            print(f"Sent: {line}")
 
 
 if __name__ == '__main__':
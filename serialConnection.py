@@ -0,0 +1,198 @@
+# One long-lived serial connection to the control module.
+#
+# Opening the port resets many boards, so the port is opened once and shared.
+# A background thread reads continuously and parses configuration matrices,
+# either binary frames (protocol='binary', see matrixProtocol.py and
+# send_matrix() in ControlModule.ino) or the older comma separated lines, one
+# per actuator (protocol='ascii'). Every complete frame goes to a bounded queue (the oldest
+# frame is dropped when it is full) and to a latest-value slot. Writes from any
+# thread go through one lock so command frames are never interleaved.
+# Subscribers (e.g. ChangeDetector.feed) are called with every frame on the
+# reader thread. If the reader thread dies the connection is marked failed and
+# every waiting and later read raises instead of blocking.
+#
+#   connection = get_connection('/dev/cu.usbmodem14401', 9600)
+#   matrix = connection.read_matrix()           # next frame after this call
+#   connection.write_lines(['1,0,0', 'END'])
+
+import queue
+import threading
+
+import serial
+
+from matrixProtocol import FrameDecoder
+
+_connections = {}
+_connections_lock = threading.Lock()
+
+
+def get_connection(port='/dev/cu.usbmodem14401', baudrate=9600, rows=5, cols=3, protocol='binary'):
+    """Shared connection for a port, opened on first use (again if it failed). Raises ValueError if
+    the port is already open with other settings."""
+    with _connections_lock:
+        connection = _connections.get(port)
+        if connection is not None and connection.error is not None:
+            connection.close()
+        if connection is None or connection.closed:
+            connection = SerialConnection(port, baudrate, rows, cols, protocol=protocol)
+            _connections[port] = connection
+        elif connection.settings != (baudrate, rows, cols, protocol):
+            raise ValueError(f"{port} is already open with baudrate, rows, cols, protocol = {connection.settings}, "
+                             f"not {(baudrate, rows, cols, protocol)}")
+        return connection
+
+
+class SerialConnection:
+    def __init__(self, port='/dev/cu.usbmodem14401', baudrate=9600, rows=5, cols=3, queue_size=64, timeout=0.1,
+                 protocol='binary'):
+        if protocol not in ('binary', 'ascii'):
+            raise ValueError(f"Unknown matrix protocol {protocol!r}")
+        self.port = port
+        self.baudrate = baudrate
+        self.rows = rows    # Actuators (MAX_ACTUATORS) and ports (NUM_INPUT_PORTS) per ASCII frame
+        self.cols = cols
+        self.protocol = protocol
+        self.decoder = FrameDecoder()   # Binary frames carry their own dimensions
+        # serial_for_url also accepts pyserial URLs such as loop:// for testing without hardware
+        self.serial = serial.serial_for_url(port, baudrate=baudrate, timeout=timeout)
+
+        self.frames = queue.Queue(maxsize=queue_size)
+        self._condition = threading.Condition()
+        self._latest = None
+        self._sequence = 0      # Number of frames parsed so far
+        self._subscribers = []
+        self._write_lock = threading.Lock()
+        self._stop = threading.Event()
+        self.closed = False
+        self.error = None       # Exception that stopped the reader thread
+
+        reader = self._read_frames if protocol == 'binary' else self._read_loop
+        self._thread = threading.Thread(target=self._run_reader, args=(reader,), name=f'serial-reader-{port}', daemon=True)
+        self._thread.start()
+
+    @property
+    def settings(self):
+        return self.baudrate, self.rows, self.cols, self.protocol
+
+    def _run_reader(self, reader):
+        try:
+            reader()
+        except Exception as e:
+            # Wake the waiting readers, they raise instead of waiting for frames that never come
+            with self._condition:
+                self.error = e
+                self._condition.notify_all()
+
+    def _read(self, read):
+        try:
+            return read()
+        except (serial.SerialException, OSError, TypeError):
+            if self._stop.is_set():
+                return b''
+            raise
+
+    def _read_frames(self):
+        while not self._stop.is_set():
+            data = self._read(lambda: self.serial.read(max(1, self.serial.in_waiting)))
+            for _, matrix in self.decoder.feed(data):
+                self._publish(matrix)
+
+    def _read_loop(self):
+        rows = []
+        while not self._stop.is_set():
+            line = self._read(self.serial.readline)
+            if not line:
+                continue
+            line = line.decode('utf-8', errors='replace').strip()
+            try:
+                row = [int(value) for value in line.split(',')]
+            except ValueError:
+                row = None
+            if row is None or len(row) != self.cols:
+                # Debug output from the control module, a frame never spans it
+                rows = []
+                continue
+            rows.append(row)
+            if len(rows) == self.rows:
+                self._publish(rows)
+                rows = []
+
+    def _publish(self, matrix):
+        with self._condition:
+            self._latest = matrix
+            self._sequence += 1
+            self._condition.notify_all()
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            try:
+                callback(matrix)
+            except Exception as e:
+                # A failing subscriber must not stop the reader thread
+                print(f"Serial subscriber {callback!r} failed on {matrix}: {e!r}")
+        while True:
+            try:
+                self.frames.put_nowait(matrix)
+                return
+            except queue.Full:
+                try:
+                    self.frames.get_nowait()    # Drop the oldest frame
+                except queue.Empty:
+                    pass
+
+    def subscribe(self, callback):
+        """Calls callback(matrix) with every frame, on the reader thread."""
+        with self._condition:
+            self._subscribers.append(callback)
+        return callback
+
+    def unsubscribe(self, callback):
+        with self._condition:
+            self._subscribers.remove(callback)
+
+    @property
+    def sequence(self):
+        return self._sequence
+
+    def latest(self):
+        """Most recent matrix, or None before the first frame."""
+        with self._condition:
+            return self._latest
+
+    def wait_for_frame(self, after=None, timeout=None):
+        """Waits for a frame newer than sequence number after (default: the current one).
+        Returns (sequence, matrix), or (sequence, None) on timeout. Raises SerialException if the
+        reader thread stopped on an error."""
+        with self._condition:
+            if after is None:
+                after = self._sequence
+            self._condition.wait_for(lambda: self._sequence > after or self.closed or self.error is not None, timeout)
+            if self._sequence > after:
+                return self._sequence, self._latest
+            if self.error is not None:
+                raise serial.SerialException(f"Serial reader for {self.port} stopped: {self.error!r}") from self.error
+            return self._sequence, None
+
+    def read_matrix(self, timeout=None):
+        """Next matrix received after this call, like opening the port and reading a fresh frame."""
+        return self.wait_for_frame(timeout=timeout)[1]
+
+    def write_lines(self, lines):
+        """Writes lines as one uninterrupted block."""
+        data = ''.join(f'{line}\n' for line in lines).encode('utf-8')
+        with self._write_lock:
+            self.serial.write(data)
+            self.serial.flush()
+
+    def close(self):
+        self._stop.set()
+        with self._condition:
+            self.closed = True
+            self._condition.notify_all()
+        self._thread.join(timeout=1)
+        self.serial.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
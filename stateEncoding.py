@@ -0,0 +1,145 @@
+# Compact integer encoding of configuration states.
+#
+# A state is normally a frozenset of (female, male) string tuples such as
+# ('M2_P2', 'M1_P4_O2'). Here every female port slot (module x P1-P3) gets a
+# fixed number of bits inside one Python int:
+#
+#   slot index = (module - 1) * 3 + (port - 1)
+#   slot value = 0 if the port is free, otherwise
+#                1 + ((module << 3 | port) << 1 | orientation - 1)
+#
+# where module/port/orientation describe the male connector plugged into it.
+# The module/port part uses the same layout as the configuration matrix bytes
+# sent by the control module (5 bit module, 3 bit port), so matrices can be
+# packed directly without building strings.
+
+FEMALE_PORTS = ("P1", "P2", "P3")
+MAX_PORT = 7        # 3 bit port field
+ORIENTATIONS = (1, 2)
+
+
+def _male_code(module, port, orient):
+    return 1 + (((module << 3) | port) << 1 | (orient - 1))
+
+
+def _cell_code(val):
+    # Configuration matrix entry -> slot value: 1 is the control module, a negative
+    # value switches the orientation, otherwise 5 bit module and 3 bit port
+    if val == 0:
+        return 0
+    if val == 1:
+        return _male_code(0, 0, 1)
+    orient = 2 if val < 0 else 1
+    val = abs(val)
+    return _male_code(val >> 3, val & 0x07, orient)
+
+
+# Slot value of every signed byte a matrix entry can hold, indexed by val & 0xFF
+CELL_CODES = [_cell_code(byte - 256 if byte > 127 else byte) for byte in range(256)]
+
+
+def state_text(state):
+    """State as written to transitions.csv, readable back with eval(). Frozenset items are sorted so
+    the text does not depend on how the set was built or on string hashing."""
+    if isinstance(state, int) or not state:
+        return str(state)
+    return 'frozenset({' + ', '.join(repr(item) for item in sorted(state)) + '})'
+
+
+class StateEncoder:
+    def __init__(self, num_modules):
+        self.num_modules = num_modules
+        self.num_slots = num_modules * len(FEMALE_PORTS)
+        self.slot_bits = _male_code(num_modules, MAX_PORT, 2).bit_length()
+        self.slot_mask = (1 << self.slot_bits) - 1
+
+        # Female key ('M1_P2') <-> slot index
+        self.slot_names = [f'M{m}_{p}' for m in range(1, num_modules + 1) for p in FEMALE_PORTS]
+        self.slot_index = {name: idx for idx, name in enumerate(self.slot_names)}
+
+        # Male connector ('M2_P4_O1') <-> slot value
+        self.male_codes = {}
+        self.male_names = {}
+        for module in range(num_modules + 1):
+            for port in range(MAX_PORT + 1):
+                for orient in ORIENTATIONS:
+                    name = f'M{module}_P{port}_O{orient}'
+                    code = _male_code(module, port, orient)
+                    self.male_codes[name] = code
+                    self.male_names[code] = name
+
+        self._actions = {}  # action string -> (slot, value), filled on first use
+
+    def encode(self, state):
+        """Packs a frozenset state into an int. Raises ValueError if the state
+        cannot be represented (unknown connector or a port used twice)."""
+        code = 0
+        for female, male in state:
+            try:
+                shift = self.slot_index[female] * self.slot_bits
+                value = self.male_codes[male]
+            except KeyError:
+                raise ValueError(f"Connection ({female}, {male}) cannot be encoded for {self.num_modules} modules")
+
+            if (code >> shift) & self.slot_mask:
+                raise ValueError(f"Port {female} is used twice in state {state}")
+            code |= value << shift
+        return code
+
+    def decode(self, code):
+        items = []
+        slot = 0
+        while code:
+            value = code & self.slot_mask
+            if value:
+                items.append((self.slot_names[slot], self.male_names[value]))
+            code >>= self.slot_bits
+            slot += 1
+        return frozenset(items)
+
+    def get_slot(self, code, slot):
+        return (code >> (slot * self.slot_bits)) & self.slot_mask
+
+    def set_slot(self, code, slot, value):
+        shift = slot * self.slot_bits
+        return (code & ~(self.slot_mask << shift)) | (value << shift)
+
+    def parse_action(self, action):
+        """Returns (slot, value) written by an action string. Disconnects write 0."""
+        parsed = self._actions.get(action)
+        if parsed is None:
+            parts = action.split('_')
+            try:
+                slot = self.slot_index[f'{parts[1]}_{parts[2]}']
+                if parts[0] == 'disconnect':
+                    value = 0
+                elif parts[3] == 'M0':
+                    value = self.male_codes[f'M0_P0_{parts[5]}']
+                else:
+                    value = self.male_codes[f'{parts[3]}_{parts[4]}_{parts[5]}']
+            except (KeyError, IndexError):
+                raise ValueError(f"Action '{action}' cannot be encoded for {self.num_modules} modules")
+            parsed = (slot, value)
+            self._actions[action] = parsed
+        return parsed
+
+    def apply_action(self, code, action):
+        slot, value = self.parse_action(action)
+        return self.set_slot(code, slot, value)
+
+    def encode_matrix(self, matrix):
+        """Packs a configuration matrix (same decoding as DFA.matrix_to_state)."""
+        code = 0
+        for module_idx, row in enumerate(matrix):
+            for port_idx, val in enumerate(row):
+                if val == 0:
+                    continue
+                if not -128 <= val <= 127:
+                    raise ValueError(f"Matrix entry {val} at M{module_idx+1}_P{port_idx+1} is not a signed byte")
+
+                value = CELL_CODES[val & 0xFF]
+                module = (value - 1) >> 4
+                if module_idx >= self.num_modules or port_idx >= len(FEMALE_PORTS) or module > self.num_modules:
+                    raise ValueError(f"Matrix entry {val} at M{module_idx+1}_P{port_idx+1} cannot be encoded for {self.num_modules} modules")
+                code |= value << ((module_idx * len(FEMALE_PORTS) + port_idx) * self.slot_bits)
+        return code
@@ -1,20 +1,54 @@
 from visualizer import ModularVisualizer
 from readMatrix import read_matrix_from_serial
 from modelChecker import run_model_checker
+from stateEncoding import StateEncoder, state_text
+from matrixDecoding import matrix_diff
+from symmetry import ModuleSymmetry
+from transitionStore import TransitionStore, write_transition_store
+from diskStore import DiskStateSet, DiskStore, DiskTransitionMap
 import time
 import csv
+import os
+import tempfile
 
+from concurrent.futures import ProcessPoolExecutor
 from itertools import product, permutations
 
 class stateGenerator:
-    def __init__(self, num_modules):
+    def __init__(self, num_modules, compact=False, symmetry=False, lazy=False, workers=1,
+                 storage='memory', storage_path=None, cache_size=100000):
         self.num_modules = num_modules
+        self.workers = workers if workers is not None else os.cpu_count()   # Processes used by generate_states
+        self.compact = compact      # Store states as packed integers (see stateEncoding.py)
+        self.encoder = StateEncoder(num_modules)
+        # Keep one representative per module relabeling class (see symmetry.py)
+        self.symmetry = ModuleSymmetry(num_modules, self.encoder) if symmetry else None
         self.states = set()  
         self.transitions = {}  
+        self.store = None
+        if storage == 'disk':
+            # Spill states and transitions to an SQLite file, only cache_size hot states stay in memory.
+            # Without a storage_path the file is temporary and deleted by close()
+            temporary = storage_path is None
+            if temporary:
+                fd, storage_path = tempfile.mkstemp(suffix='.sqlite', prefix='states_')
+                os.close(fd)
+            self.store = DiskStore(storage_path, self.encoder, compact, temporary)
+            self.states = DiskStateSet(self.store, cache_size)
+            self.transitions = DiskTransitionMap(self.store)
+        elif storage != 'memory':
+            raise ValueError(f"Unknown storage '{storage}', expected 'memory' or 'disk'")
         self.current_state = None 
+        self.possible_actions = None    # Action catalogue and its per-port index, see build_action_index
+        self.connect_index = None
+        self.disconnect_index = None
         self.define_connections()
-        self.generate_states()
-        self.occupied = {}
+        if lazy:
+            # States are expanded on demand through successors(), only the start state is stored
+            self.add_state(frozenset(), is_start=True)
+        else:
+            self.generate_states()
+        self.last_matrix = None     # Matrix the last action_config_matrix call ended in
        
     def define_connections(self):
         self.femalePorts = ["P1", "P2", "P3"]
@@ -22,103 +56,359 @@ class stateGenerator:
         self.orientations = ["O1", "O2"]
        
     def generate_states(self):
-        start_state = frozenset()
-        self.states.add(start_state)
-        self.current_state = start_state
+        self.add_state(frozenset(), is_start=True)
 
-        for num_connected in range(1, self.num_modules + 1):
-            for modules in permutations(range(1, 1+self.num_modules), num_connected):
-                modules = (0,) + modules  # Adds control module (0) to every state
-                
-                state_items = [[] for _ in range(len(modules)-1)]
-                for i, module in enumerate(modules):
-                    
-                    # Generate all control module elements in states
-                    if i == 0:
-                        for connections in product(self.femalePorts, self.orientations):
-                            fPort, orientation = connections
-                            next_module = modules[i + 1]
-                            state_item = (f'M{next_module}_{fPort}', f'M0_P0_{orientation}')
-                            state_items[i].append(state_item)
-
-                    if i < len(modules) - 1 and i != 0:
-                        for j in range(i):
-                            for connections in product(self.malePorts, self.femalePorts, self.orientations):
-                                mPort, fPort, orientation = connections
-                                next_module = modules[i + 1]
-                                state_item = (f'M{modules[i-j]}_{fPort}', f'M{next_module}_{mPort}_{orientation}')    
-                                state_items[i].append(state_item) 
-                             
-                        for k in range(i):
-                            for connections in product(self.malePorts, self.femalePorts, self.orientations):
-                                mPort, fPort, orientation = connections
-                                next_module = modules[i + 1]
-                                state_item = (f'M{next_module}_{fPort}', f'M{modules[i-k]}_{mPort}_{orientation}')    
-                                state_items[i].append(state_item) 
-
-                for state_combination in product(*state_items):
-                    connection_tracker = {}
-                    valid_state = True
-
-                    # Checks for duplicates on same connector
-                    for item in state_combination:
-                        for connection in item:
-                            module_port = connection.split('_')
-                            connection_key = (module_port[0], module_port[1])
-                        
-                            if connection_key in connection_tracker:
-                                valid_state = False  # Duplicate found
-                                break
-                            connection_tracker[connection_key] = True 
-                    
+        if self.workers > 1:
+            self.generate_states_parallel()
+            return
 
-                    # Only add the state if it's valid (no duplicates)
-                    if valid_state:
-                        state = frozenset(state_combination)
-                        if state not in self.states:
-                            self.add_state(state)
+        for modules in self.module_orders():
+            for state in self.states_for_modules(modules):
+                self.add_state(state)
 
-                    state = frozenset(state_combination)
-                    self.add_state(state)
+        # Generate transitions for each state (states are streamed, not copied, in disk mode)
+        for state in self.states if self.store is not None else list(self.states):
+            self.generate_transitions_for_state(state)
+        if self.store is not None:
+            self.transitions.flush()
 
+    # Orders in which modules are attached, each one is handled independently by states_for_modules
+    def module_orders(self):
+        for num_connected in range(1, self.num_modules + 1):
+            if self.symmetry is not None:
+                # Every other ordering is a relabeling of the states built from 1..num_connected
+                yield tuple(range(1, num_connected + 1))
+            else:
+                yield from permutations(range(1, 1+self.num_modules), num_connected)
+
+    def states_for_modules(self, modules):
+        modules = (0,) + modules  # Adds control module (0) to every state
+        
+        state_items = [[] for _ in range(len(modules)-1)]
+        for i, module in enumerate(modules):
+            
+            # Generate all control module elements in states
+            if i == 0:
+                for connections in product(self.femalePorts, self.orientations):
+                    fPort, orientation = connections
+                    next_module = modules[i + 1]
+                    state_item = (f'M{next_module}_{fPort}', f'M0_P0_{orientation}')
+                    state_items[i].append(state_item)
+
+            if i < len(modules) - 1 and i != 0:
+                for j in range(i):
+                    for connections in product(self.malePorts, self.femalePorts, self.orientations):
+                        mPort, fPort, orientation = connections
+                        next_module = modules[i + 1]
+                        state_item = (f'M{modules[i-j]}_{fPort}', f'M{next_module}_{mPort}_{orientation}')    
+                        state_items[i].append(state_item) 
+                     
+                for k in range(i):
+                    for connections in product(self.malePorts, self.femalePorts, self.orientations):
+                        mPort, fPort, orientation = connections
+                        next_module = modules[i + 1]
+                        state_item = (f'M{next_module}_{fPort}', f'M{modules[i-k]}_{mPort}_{orientation}')    
+                        state_items[i].append(state_item) 
 
-                # Linear spatial states (ring formation)
-                state_items = [[] for _ in range(len(modules))]
-                for i, module in enumerate(modules):
-                    if i == 0:
-                        for fPort in ["P2", "P3"]:
-                            state_item = (f'M{modules[i+1]}_{fPort}', f'M0_P0_O1')
-                            state_items[i].append(state_item)
-                            
-                    if i < len(modules) - 1 and i != 0:
-                        state_item = (f'M{modules[i+1]}_P1', f'M{modules[i]}_P4_O1')  
-                        state_items[i].append(state_item)
-
-                    # Attaches last module to port of the first to create a ring formation
-                    if i == len(modules) - 1 and i > 1:
-                        state_item = (f'M{modules[1]}_P1', f'M{modules[i]}_P4_O1') 
-                        state_items[i].append(state_item)
-
-                for state_combination in product(*state_items):
-                    state = frozenset(state_combination)
-                    self.add_state(state)
+        # Only valid (no duplicates) combinations are built
+        yield from self.valid_combinations(state_items)
 
-        # Generate transitions for each state
-        for state in list(self.states):
-            self.generate_transitions_for_state(state)
+
+        # Linear spatial states (ring formation)
+        state_items = [[] for _ in range(len(modules))]
+        for i, module in enumerate(modules):
+            if i == 0:
+                for fPort in ["P2", "P3"]:
+                    state_item = (f'M{modules[i+1]}_{fPort}', f'M0_P0_O1')
+                    state_items[i].append(state_item)
+                    
+            if i < len(modules) - 1 and i != 0:
+                state_item = (f'M{modules[i+1]}_P1', f'M{modules[i]}_P4_O1')  
+                state_items[i].append(state_item)
+
+            # Attaches last module to port of the first to create a ring formation
+            if i == len(modules) - 1 and i > 1:
+                state_item = (f'M{modules[1]}_P1', f'M{modules[i]}_P4_O1') 
+                state_items[i].append(state_item)
+
+        for state_combination in product(*state_items):
+            yield frozenset(state_combination)
+
+    # Depth-first enumeration of one item per list. A partial assignment is dropped as soon as a
+    # connector is used twice, so invalid combinations are never completed
+    def valid_combinations(self, state_items):
+        options = [[(item, [tuple(connection.split('_')[:2]) for connection in item]) for item in items]
+                   for items in state_items]
+        chosen = []
+        used = set()
+
+        def extend(depth):
+            if depth == len(options):
+                yield frozenset(chosen)
+                return
+
+            for item, connectors in options[depth]:
+                if any(connector in used for connector in connectors):
+                    continue
+                chosen.append(item)
+                used.update(connectors)
+                yield from extend(depth + 1)
+                chosen.pop()
+                used.difference_update(connectors)
+
+        yield from extend(0)
 
     def add_state(self, state, is_start=False):
+        if self.compact and not isinstance(state, int):
+            state = self.encoder.encode(state)
+        if self.symmetry is not None:
+            state = self.symmetry.canonicalize(state)[0]
         self.states.add(state)
         if is_start:
             self.current_state = state
 
     def generate_transitions_for_state(self, state):
-        possible_actions = self.generate_possible_actions()
-        for action in possible_actions:
+        for action, new_state in self.transitions_for_state(state):
+            self.add_transition(state, action, new_state)
+
+    # (action, new_state) pairs leaving a state that end in a known state
+    def transitions_for_state(self, state, module=None):
+        result = []
+        for action in self.applicable_actions(state):
+            if module is not None and module not in self.action_modules(action):
+                continue    # Only actions involving this module
             new_state = self.apply_action(state, action)
+            if self.symmetry is not None:
+                new_state = self.symmetry.canonicalize(new_state)[0]
             if new_state in self.states:
-                self.add_transition(state, action, new_state)
-
+                result.append((action, new_state))
+        return result
+
+    # Same result as the serial loop in generate_states, exported files are identical.
+    # Module orders and states are split into shards, workers send back packed integer states and
+    # (from, action index, to) triples, and shards are merged in order. States are inserted in the
+    # serial order and transitions are computed in the order generate_states iterates the states.
+    def generate_states_parallel(self):
+        orders = list(self.module_orders())
+        # Memory mode: packed code -> state, so every state is decoded once and not again per
+        # transition. The disk store takes packed codes as they are and is not copied into memory
+        decoded = None if self.store is not None else \
+            {state if self.compact else self.encoder.encode(state): state for state in self.states}
+        with ProcessPoolExecutor(self.workers) as pool:
+            shards = pool.map(_state_shard, [(self.num_modules, self.symmetry is not None, chunk)
+                                             for chunk in _split(orders, self.workers * 4)])
+            for shard in shards:
+                for code in shard:
+                    if decoded is None:
+                        self.states.add(code)
+                    elif code not in decoded:
+                        decoded[code] = state = code if self.compact else self.encoder.decode(code)
+                        self.states.add(state)
+
+        if decoded is None:
+            codes = list(self.store.codes())
+            lookup = lambda code: code      # The disk tables take packed codes
+        else:
+            codes = [state if self.compact else self.encoder.encode(state) for state in self.states]
+            lookup = decoded.__getitem__
+        if self.possible_actions is None:
+            self.build_action_index()
+        actions = self.possible_actions
+        with ProcessPoolExecutor(self.workers, initializer=_init_transition_worker,
+                                 initargs=(self.num_modules, self.symmetry is not None, codes)) as pool:
+            for shard in pool.map(_transition_shard, _split(codes, self.workers * 4)):
+                for from_code, action_idx, to_code in shard:
+                    self.add_transition(lookup(from_code), actions[action_idx], lookup(to_code))
+        if self.store is not None:
+            self.transitions.flush()
+
+    # Checks the rules generate_states builds states from: every connector is used once, the
+    # control module is attached exactly once and the modules form a tree below it, or a ring
+    def is_valid_state(self, state):
+        if isinstance(state, int):
+            return self.is_valid_code(state)
+        if not state:
+            return True
+
+        modules = [f'M{i+1}' for i in range(self.num_modules)]
+        used = set()
+        edges = []
+        control_edges = []
+        for female, male in state:
+            f_module, f_port = female.split('_')
+            m_module, m_port, orient = male.split('_')
+
+            if f_module not in modules or f_port not in self.femalePorts or orient not in self.orientations:
+                return False
+            if m_module == 'M0':
+                if m_port != 'P0':
+                    return False
+                control_edges.append((f_port, orient))
+            elif m_module not in modules or m_port not in self.malePorts or m_module == f_module:
+                return False
+
+            for connector in ((f_module, f_port), (m_module, m_port)):
+                if connector in used:
+                    return False
+                used.add(connector)
+            edges.append((f_module, f_port, m_module, m_port, orient))
+
+        if len(control_edges) != 1:
+            return False
+
+        # All modules have to be connected to the control module
+        neighbours = {}
+        for f_module, _, m_module, _, _ in edges:
+            neighbours.setdefault(f_module, []).append(m_module)
+            neighbours.setdefault(m_module, []).append(f_module)
+        seen = {'M0'}
+        stack = ['M0']
+        while stack:
+            for module in neighbours[stack.pop()]:
+                if module not in seen:
+                    seen.add(module)
+                    stack.append(module)
+        if len(seen) != len(neighbours):
+            return False
+
+        if len(edges) == len(seen) - 1:
+            return True
+
+        # One extra edge is only allowed for the ring formation (P4 -> P1 chain, control on P2/P3)
+        if len(edges) == len(seen) and len(seen) > 2:
+            f_port, orient = control_edges[0]
+            if f_port not in ("P2", "P3") or orient != "O1":
+                return False
+            return all(edge[1] == "P1" and edge[3] == "P4" and edge[4] == "O1"
+                       for edge in edges if edge[2] != 'M0')
+        return False
+
+    # Same rules as is_valid_state, read straight from the slot values of a packed state
+    def is_valid_code(self, code):
+        return self.code_structure(code) is not None
+
+    # Structure of a packed state, or None if it breaks the rules of is_valid_state: (edges, modules,
+    # control, ring, degree) with the number of connections, the number of modules in the configuration
+    # (control module included), the control connection as (female port, orientation), whether every
+    # module-to-module connection is P4 -> P1 with O1 and the number of connections per module
+    def code_structure(self, code):
+        num_ports = len(self.femalePorts)
+        used = set()
+        neighbours = {}
+        edges = 0
+        control = None
+        ring = True
+        slot = 0
+        while code:
+            value = code & self.encoder.slot_mask
+            code >>= self.encoder.slot_bits
+            slot += 1
+            if not value:
+                continue
+            male = (value - 1) >> 1
+            orient = ((value - 1) & 1) + 1
+            m_module, m_port = male >> 3, male & 0x07
+            f_module, f_port = (slot - 1) // num_ports + 1, (slot - 1) % num_ports + 1
+
+            if m_module == 0:
+                if m_port != 0 or control is not None:
+                    return None
+                control = (f_port, orient)
+            elif m_module > self.num_modules or not 4 <= m_port <= 6 or m_module == f_module:
+                return None
+            else:
+                ring = ring and f_port == 1 and m_port == 4 and orient == 1
+            if male in used:
+                return None
+            used.add(male)
+            neighbours.setdefault(f_module, []).append(m_module)
+            neighbours.setdefault(m_module, []).append(f_module)
+            edges += 1
+
+        if not edges:
+            return 0, 1, None, True, {}
+        if control is None:
+            return None
+
+        # All modules have to be connected to the control module
+        seen = {0}
+        stack = [0]
+        while stack:
+            for module in neighbours[stack.pop()]:
+                if module not in seen:
+                    seen.add(module)
+                    stack.append(module)
+        if len(seen) != len(neighbours):
+            return None
+
+        # One extra edge is only allowed for the ring formation (P4 -> P1 chain, control on P2/P3)
+        if edges == len(seen) - 1 or (edges == len(seen) and len(seen) > 2
+                                      and control[0] in (2, 3) and control[1] == 1 and ring):
+            return edges, len(seen), control, ring, {module: len(adjacent) for module, adjacent in neighbours.items()}
+        return None
+
+    # Whether writing value into slot keeps a valid tree-shaped state (structure from code_structure,
+    # old the slot's current value) valid. Only the changed connection is looked at
+    def tree_successor_valid(self, structure, slot, old, value):
+        edges, _, control, ring, degree = structure
+        num_ports = len(self.femalePorts)
+        f_module, f_port = slot // num_ports + 1, slot % num_ports + 1
+        if value == 0:
+            m_module = ((old - 1) >> 1) >> 3
+            if m_module == 0:
+                return edges == 1   # Only the last connection may leave the control module
+            # A tree connection splits the configuration unless one side is left with no connections
+            return degree[f_module] == 1 or degree[m_module] == 1
+
+        male = (value - 1) >> 1
+        m_module = male >> 3
+        if m_module == 0:
+            return edges == 0
+        if (f_module in degree) != (m_module in degree):
+            return True     # One side joins the configuration
+        if f_module not in degree:
+            return False
+        # Closing a cycle is only allowed for the ring formation
+        return (control[0] in (2, 3) and control[1] == 1 and ring
+                and f_port == 1 and male & 0x07 == 4 and (value - 1) & 1 == 0)
+
+    # Successor function for on-the-fly exploration (see ModelChecker's TransitionFunction). Candidates
+    # are checked on the packed code, incrementally when the state is a tree, and only valid ones are
+    # built as frozensets
+    def successors(self, state):
+        compact = isinstance(state, int)
+        code = state if compact else self.encoder.encode(state)
+        structure = self.code_structure(code)
+        if structure is not None and structure[0] != structure[1] - 1:
+            structure = None    # Rings are checked in full
+        # A tree can only gain a cycle if it can still become a ring
+        joins_only = structure is not None and not (structure[2] is not None and structure[2][0] in (2, 3)
+                                                    and structure[2][1] == 1 and structure[3])
+        values = [self.encoder.get_slot(code, slot) for slot in range(self.encoder.num_slots)]
+        result = []
+        for action in self.applicable_actions(code, joins_only):
+            slot, value = self.encoder.parse_action(action)
+            if structure is not None:
+                if not self.tree_successor_valid(structure, slot, values[slot], value):
+                    continue
+            elif not self.is_valid_code(self.encoder.set_slot(code, slot, value)):
+                continue
+            result.append((action, self.encoder.set_slot(code, slot, value) if compact else self.apply_action(state, action)))
+        return result
+
+    # Incoming edges [(action, predecessor)]. Every connect is undone by a disconnect and the
+    # other way around, so these are the successors with the inverse action
+    def predecessors(self, state):
+        code = state if isinstance(state, int) else self.encoder.encode(state)
+        result = []
+        for action, previous in self.successors(state):
+            slot, value = self.encoder.parse_action(action)
+            if value == 0:
+                inverse = f'connect_{self.encoder.slot_names[slot]}_{self.encoder.male_names[self.encoder.get_slot(code, slot)]}'
+            else:
+                inverse = f'disconnect_{self.encoder.slot_names[slot]}'
+            result.append((inverse, previous))
+        return result
 
     def add_transition(self, from_state, action, to_state, reset=False):
         if from_state not in self.states or to_state not in self.states:
@@ -126,6 +416,150 @@ class stateGenerator:
         
         self.transitions[(from_state, action)] = to_state
 
+    # Modules (female side, male side) an action connects or disconnects
+    def action_modules(self, action):
+        slot, value = self.encoder.parse_action(action)
+        female_module = slot // len(self.femalePorts) + 1
+        if value == 0:
+            return (female_module,)
+        return (female_module, (value - 1) >> 4)
+
+    # Releases the disk store (storage='disk'), a temporary SQLite file is deleted
+    def close(self):
+        if self.store is not None:
+            self.transitions.flush()
+            self.store.close()
+            self.store = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # Loads a generator from a binary transition store instead of generating it. States and
+    # transitions are read-only views of the memory-mapped store until add_module rebuilds them
+    @classmethod
+    def from_store(cls, filename, compact=False):
+        store = TransitionStore(filename)
+        generator = cls(store.num_modules, compact=compact, symmetry=store.symmetry_reduced, lazy=True)
+        generator.states = store.state_set(compact)
+        generator.transitions = store.transition_table(compact)
+        return generator
+
+    # Extends the generated state space from num_modules to num_modules + 1. Only the states that
+    # contain the new module and the transitions that involve it are computed, the result is the
+    # same as generating stateGenerator(num_modules + 1) from scratch
+    def add_module(self):
+        old_encoder = self.encoder
+        new_module = self.num_modules + 1
+        self.num_modules = new_module
+        self.encoder = StateEncoder(new_module)
+        if self.symmetry is not None:
+            self.symmetry = ModuleSymmetry(new_module, self.encoder)
+        self.possible_actions = self.connect_index = self.disconnect_index = None
+
+        # Packed codes depend on the bits per port and representatives on the set of
+        # relabelings, so existing states are converted first
+        def convert(state):
+            if self.compact:
+                state = self.encoder.encode(old_encoder.decode(state))
+            if self.symmetry is not None:
+                return self.symmetry.canonicalize(state)
+            return state, None
+
+        if self.store is not None:
+            # Disk mode: the old tables are converted into new ones batch by batch
+            self.transitions.flush()
+            old_store = self.store.reencode(self.encoder)
+            old_states, old_transitions = old_store.states(), DiskTransitionMap(old_store)
+            self.states = DiskStateSet(self.store, self.states.cache_size)
+            self.transitions = DiskTransitionMap(self.store)
+            lookup = convert
+        else:
+            converted = {state: convert(state) for state in self.states}
+            old_states, old_transitions = converted, self.transitions
+            self.states, self.transitions = set(), {}
+            lookup = converted.__getitem__
+
+        for state in old_states:
+            self.states.add(lookup(state)[0])
+        for (from_state, action), to_state in old_transitions.items():
+            new_from, perm = lookup(from_state)
+            if perm is not None:
+                action = self.symmetry.relabel_action(action, self.symmetry.inverse(perm))
+            self.transitions[(new_from, action)] = lookup(to_state)[0]
+        if self.current_state is not None:
+            self.current_state = convert(self.current_state)[0]
+        if self.store is not None:
+            self.transitions.flush()
+            old_store.drop()
+
+        for modules in self.module_orders():
+            if new_module in modules:
+                for state in self.states_for_modules(modules):
+                    self.add_state(state)
+
+        # Every state with the new module in it is new, earlier states only gain its transitions
+        tag = f'M{new_module}_'
+        for state in self.states if self.store is not None else list(self.states):
+            if any(female.startswith(tag) or male.startswith(tag) for female, male in self.decode_state(state)):
+                self.generate_transitions_for_state(state)
+            else:
+                for action, new_state in self.transitions_for_state(state, module=new_module):
+                    self.add_transition(state, action, new_state)
+        if self.store is not None:
+            self.transitions.flush()
+
+    # Generates the action catalogue once and indexes it by the female port slot each action writes
+    def build_action_index(self):
+        self.possible_actions = self.generate_possible_actions()
+        self.connect_index = [[] for _ in range(self.encoder.num_slots)]
+        self.disconnect_index = [None] * self.encoder.num_slots
+
+        for action in self.possible_actions:
+            slot, value = self.encoder.parse_action(action)
+            if value == 0:
+                self.disconnect_index[slot] = action
+            else:
+                male = (value - 1) >> 1     # module << 3 | port of the male connector
+                self.connect_index[slot].append((action, male, male >> 3))
+
+    # Actions whose preconditions hold in a state: disconnects on occupied ports, connects on
+    # free ports with an unused male connector and at least one side already in the configuration.
+    # With joins_only, connects between two modules that are both present (cycles) are left out
+    def applicable_actions(self, state, joins_only=False):
+        if self.possible_actions is None:
+            self.build_action_index()
+
+        code = state if isinstance(state, int) else self.encoder.encode(state)
+        num_ports = len(self.femalePorts)
+        values = [self.encoder.get_slot(code, slot) for slot in range(self.encoder.num_slots)]
+
+        used = set()
+        present = {0}   # Control module is always there
+        for slot, value in enumerate(values):
+            if value:
+                male = (value - 1) >> 1
+                used.add(male)
+                present.add(male >> 3)
+                present.add(slot // num_ports + 1)
+
+        actions = []
+        for slot, value in enumerate(values):
+            if value:
+                actions.append(self.disconnect_index[slot])
+                continue
+
+            female_present = slot // num_ports + 1 in present
+            for action, male, module in self.connect_index[slot]:
+                if male in used or not (female_present or module in present):
+                    continue
+                if joins_only and female_present and module in present:
+                    continue
+                actions.append(action)
+        return actions
+
     #Generates all possible actions between states
     def generate_possible_actions(self):
         actions = []
@@ -145,6 +579,9 @@ class stateGenerator:
 
     #Applies possible actions to produce new states
     def apply_action(self, state, action):
+        if isinstance(state, int):
+            return self.encoder.apply_action(state, action)
+
         state_dict = dict(state)
         parts = action.split('_')  
     
@@ -175,70 +612,97 @@ class stateGenerator:
             self.current_state = new_state
         
             visualizer = ModularVisualizer()
-            visualizer.visualize_configuration(self.current_state)
+            visualizer.visualize_configuration(self.decode_state(self.current_state))
         else:
             print(f"No valid transition from state '{self.current_state}' on action '{action}'")
 
 
     def action_config_matrix(self, matrix):
-        actions = []
-        for module_idx, row in enumerate(matrix):
-            for port_idx, val in enumerate(row):
-                occupied_key = (module_idx, port_idx)
-
-                # 1 indicates the presence of the control module
-                if val == 1:
-                    if occupied_key not in self.occupied:
-                        self.occupied[occupied_key] = True
-                        actions.append(f'connect_M{module_idx+1}_P{port_idx+1}_M0_P0_O1')
-
-                # Non-zero indicates an actuator is connected on that port
-                elif val != 0:
-                    if occupied_key not in self.occupied:
-                        self.occupied[occupied_key] = True
-
-                        # Decodes actuator number and port number
-                        binary_val = format(val, '08b')
-                        port_num = int(binary_val[-3:], 2)
-                        module_num = int(binary_val[:5], 2)
-
-                        actions.append(f'connect_M{module_idx+1}_P{port_idx+1}_M{module_num}_P{port_num}_O1')
-                        print(f'M{module_idx+1}_P{port_idx+1}_M{module_num}_P{port_num}')
-                else: 
-                    # If status of port changes (value to zero), disconnect actuator 
-                    if occupied_key in self.occupied:
-                        actions.append(f'disconnect_M{module_idx+1}_P{port_idx+1}')
-                        self.occupied.pop(occupied_key)
+        # Actions between the last matrix read and this one, control module connects come
+        # before other connects (for visualization)
+        actions = matrix_diff(self.last_matrix, matrix)
+        self.last_matrix = matrix
 
         print(actions)
-
-        ## Makes sure that control module is first action (for visualization)
-        for action in actions:
-            if "M0" in action:
-                self.perform_action(action)
-            time.sleep(.5)
-
         for action in actions:
             self.perform_action(action)
             time.sleep(.5)   
 
     
-    def export_transitions(self, filename='transitions.csv'):
-        # Prepare data 
-        csv_data = []
-        for (from_state, action), to_state in self.transitions.items():
-            from_state_str = str(from_state)  # Convert frozenset to string
-            to_state_str = str(to_state) 
-            csv_data.append([from_state_str, action, to_state_str]) 
+    # Returns the frozenset form of a state, whichever representation is in use
+    def decode_state(self, state):
+        if isinstance(state, int):
+            return self.encoder.decode(state)
+        return state
+
+    # Writes the binary transition store (see transitionStore.py), or CSV for a .csv filename
+    def export_transitions(self, filename='transitions.bin', decode=False):
+        if not filename.endswith('.csv'):
+            if self.store is not None:
+                # Streamed from the SQLite tables in sorted order
+                self.transitions.flush()
+                self.store.export_store(filename, symmetry_reduced=self.symmetry is not None)
+            else:
+                write_transition_store(filename, self.transitions, self.encoder, states=self.states,
+                                       symmetry_reduced=self.symmetry is not None)
+            print(f"Transitions exported to {filename}")
+            return
 
         with open(filename, mode='w', newline='') as f:
             writer = csv.writer(f)
             writer.writerow(['From State', 'Action', 'To State'])  # header
-            writer.writerows(csv_data) 
+            # Rows are written as they are read, disk-backed tables are never held in memory
+            for (from_state, action), to_state in self.transitions.items():
+                if decode:
+                    from_state, to_state = self.decode_state(from_state), self.decode_state(to_state)
+                writer.writerow([state_text(from_state), action, state_text(to_state)])   # frozenset (or packed int) as string
 
         print(f"Transitions exported to {filename}")
 
 
+# Process pool helpers for stateGenerator.generate_states_parallel
+def _split(items, count):
+    size = max(1, -(-len(items) // max(1, count)))
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def _state_shard(args):
+    num_modules, symmetry, orders = args
+    generator = stateGenerator(num_modules, compact=True, symmetry=symmetry, lazy=True)
+
+    # Packed states in order of first appearance, like the serial loop adds them
+    shard = []
+    seen = set()
+    for modules in orders:
+        for state in generator.states_for_modules(modules):
+            code = generator.encoder.encode(state)
+            if generator.symmetry is not None:
+                code = generator.symmetry.canonicalize(code)[0]
+            if code not in seen:
+                seen.add(code)
+                shard.append(code)
+    return shard
+
+
+_worker_generator = None
+_worker_actions = None
+
+
+def _init_transition_worker(num_modules, symmetry, codes):
+    global _worker_generator, _worker_actions
+    _worker_generator = stateGenerator(num_modules, compact=True, symmetry=symmetry, lazy=True)
+    _worker_generator.states = set(codes)
+    _worker_actions = {action: idx for idx, action in enumerate(_worker_generator.generate_possible_actions())}
+
+
+def _transition_shard(codes):
+    shard = []
+    for code in codes:
+        for action, new_code in _worker_generator.transitions_for_state(code):
+            shard.append((code, _worker_actions[action], new_code))
+    return shard
+
+
 if __name__ == "__main__":
     num_modules = 3
     stateGen = stateGenerator(num_modules)
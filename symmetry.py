@@ -0,0 +1,85 @@
+# Symmetry reduction under module relabeling.
+#
+# Actuators 1..N are interchangeable: renaming them maps valid states to valid
+# states and transitions to transitions. The reduced state space keeps one
+# representative per equivalence class (the relabeling with the smallest packed
+# integer code). A relabeling is a tuple perm with perm[old_id] = new_id and
+# perm[0] = 0, since the control module is never renamed.
+
+from itertools import permutations
+
+from stateEncoding import FEMALE_PORTS, StateEncoder
+
+
+class ModuleSymmetry:
+    def __init__(self, num_modules, encoder=None):
+        self.num_modules = num_modules
+        self.encoder = encoder if encoder is not None else StateEncoder(num_modules)
+        self.perms = [(0,) + perm for perm in permutations(range(1, num_modules + 1))]
+        self.identity = self.perms[0]
+
+    @staticmethod
+    def inverse(perm):
+        inv = [0] * len(perm)
+        for old, new in enumerate(perm):
+            inv[new] = old
+        return tuple(inv)
+
+    def _relabel_code(self, code, perm):
+        bits, mask = self.encoder.slot_bits, self.encoder.slot_mask
+        num_ports = len(FEMALE_PORTS)
+        relabeled = 0
+        slot = 0
+        while code:
+            value = code & mask
+            if value:
+                # Male module sits above the port and orientation bits
+                module = (value - 1) >> 4
+                value += (perm[module] - module) << 4
+                new_slot = (perm[slot // num_ports + 1] - 1) * num_ports + slot % num_ports
+                relabeled |= value << (new_slot * bits)
+            code >>= bits
+            slot += 1
+        return relabeled
+
+    def relabel(self, state, perm):
+        if isinstance(state, int):
+            return self._relabel_code(state, perm)
+        return self.encoder.decode(self._relabel_code(self.encoder.encode(state), perm))
+
+    def relabel_action(self, action, perm):
+        parts = action.split('_')
+        module_fields = (1,) if parts[0] == 'disconnect' else (1, 3)
+        for idx in module_fields:
+            parts[idx] = f'M{perm[int(parts[idx][1:])]}'
+        return '_'.join(parts)
+
+    def canonicalize(self, state):
+        """Returns (representative, perm) with relabel(representative, perm) == state.
+        The representative has the same type (int or frozenset) as the state."""
+        code = state if isinstance(state, int) else self.encoder.encode(state)
+
+        best, best_perm = code, self.identity
+        for perm in self.perms[1:]:
+            candidate = self._relabel_code(code, perm)
+            if candidate < best:
+                best, best_perm = candidate, perm
+
+        if not isinstance(state, int):
+            best = self.encoder.decode(best)
+        return best, self.inverse(best_perm)
+
+    def apply_action(self, state, action):
+        if isinstance(state, int):
+            return self.encoder.apply_action(state, action)
+        return self.encoder.decode(self.encoder.apply_action(self.encoder.encode(state), action))
+
+    def successors(self, state, reduced_transitions):
+        """Concrete successors of a concrete state, looked up in a reduced
+        ModelChecker style table {representative: [(action, representative)]}."""
+        rep, perm = self.canonicalize(state)
+        result = []
+        for action, _ in reduced_transitions.get(rep, []):
+            concrete_action = self.relabel_action(action, perm)
+            result.append((concrete_action, self.apply_action(state, concrete_action)))
+        return result
@@ -0,0 +1,73 @@
+# Tests for the table-driven matrix decoding (matrixDecoding.py).
+#
+#   python -m pytest test_matrixDecoding.py
+
+import random
+
+from matrixDecoding import male_name, matrices_to_codes, matrices_to_states, matrix_diff, matrix_to_state
+from stateEncoding import StateEncoder
+
+INITIAL = [[1, 0, 0],
+           [0, 0, 0],
+           [12, 0, 0]]
+
+DESIRED = [[20, 1, 0],
+           [0, 0, 0],
+           [0, 0, 0]]
+
+
+def test_male_names():
+    assert male_name(0) is None
+    assert male_name(1) == 'M0_P0_O1'       # Control module
+    assert male_name(20) == 'M2_P4_O1'      # Module 2, port 4
+    assert male_name(-12) == 'M1_P4_O2'     # Negative values switch the orientation
+
+
+def test_matrix_to_state():
+    assert matrix_to_state(INITIAL) == frozenset({('M1_P1', 'M0_P0_O1'), ('M3_P1', 'M1_P4_O1')})
+    assert matrix_to_state([[0, 0, 0]]) == frozenset()
+
+
+def test_no_change():
+    assert matrix_diff(INITIAL, INITIAL) == []
+
+
+def test_from_empty_matrix():
+    # Connects to the control module come before the other connects
+    assert matrix_diff(None, DESIRED) == ['connect_M1_P2_M0_P0_O1', 'connect_M1_P1_M2_P4_O1']
+
+
+def test_disconnects_come_first():
+    assert matrix_diff(INITIAL, DESIRED) == ['disconnect_M1_P1', 'disconnect_M3_P1',
+                                             'connect_M1_P2_M0_P0_O1', 'connect_M1_P1_M2_P4_O1']
+
+
+def test_orientation_change():
+    assert matrix_diff([[0, 12, 0]], [[0, -12, 0]]) == ['disconnect_M1_P2', 'connect_M1_P2_M1_P4_O2']
+
+
+def test_missing_cells_are_free_ports():
+    # Rows or columns missing from either matrix count as zeros
+    assert matrix_diff(INITIAL, [[1, 0, 0]]) == ['disconnect_M3_P1']
+    assert matrix_diff([[1]], INITIAL) == ['connect_M3_P1_M1_P4_O1']
+    assert matrix_diff([[1, 0, 0], [0, 0, 0]], [[1], [0, 20]]) == ['connect_M2_P2_M2_P4_O1']
+
+
+def test_diff_actions_lead_to_the_new_state():
+    encoder = StateEncoder(3)
+    rng = random.Random(1)
+    values = [0, 0, 0, 1, 12, -12, 20, -21, 30]
+    for _ in range(200):
+        old = [[rng.choice(values) for _ in range(3)] for _ in range(3)]
+        new = [[rng.choice(values) for _ in range(3)] for _ in range(rng.randint(1, 3))]
+        code = encoder.encode_matrix(old)
+        for action in matrix_diff(old, new):
+            code = encoder.apply_action(code, action)
+        assert code == encoder.encode_matrix(new)
+
+
+def test_stacks_match_single_matrices():
+    encoder = StateEncoder(3)
+    stack = [INITIAL, DESIRED, [[0, 0, 0]] * 3]
+    assert matrices_to_states(stack) == [matrix_to_state(matrix) for matrix in stack]
+    assert matrices_to_codes(stack, encoder) == [encoder.encode_matrix(matrix) for matrix in stack]
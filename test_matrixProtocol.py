@@ -0,0 +1,75 @@
+# Tests for the binary configuration matrix frames (matrixProtocol.py).
+#
+#   python -m pytest test_matrixProtocol.py
+
+import pytest
+
+from matrixProtocol import HEADER_SIZE, MAX_DIMENSION, SYNC, FrameDecoder, crc16, encode_frame
+
+MATRIX = [[20, 1, 0],
+          [0, -12, 0],
+          [127, -128, 0]]
+
+
+def test_crc16_check_value():
+    # Standard check value of CRC-16/CCITT-FALSE
+    assert crc16(b'123456789') == 0x29B1
+
+
+def test_round_trip():
+    frame = encode_frame(MATRIX, sequence=7)
+    assert frame.startswith(SYNC) and len(frame) == HEADER_SIZE + 9 + 2
+    assert FrameDecoder().feed(frame) == [(7, MATRIX)]
+
+
+def test_frames_split_across_reads():
+    decoder = FrameDecoder()
+    stream = encode_frame(MATRIX, 1) + encode_frame(MATRIX, 2)
+    frames = []
+    for byte in range(len(stream)):
+        frames += decoder.feed(stream[byte:byte + 1])
+    assert frames == [(1, MATRIX), (2, MATRIX)]
+    assert decoder.dropped == 0 and decoder.rejected == 0
+
+
+def test_resync_after_garbage():
+    decoder = FrameDecoder()
+    # Debug text, a stray sync marker and a truncated frame before a good one
+    garbage = b'debug: hello\r\n' + SYNC + b'\x00' + encode_frame(MATRIX, 3)[:6]
+    assert decoder.feed(garbage + encode_frame(MATRIX, 4)) == [(4, MATRIX)]
+    assert decoder.rejected >= 1
+
+
+def test_bad_crc_is_rejected():
+    frame = bytearray(encode_frame(MATRIX, 5))
+    frame[HEADER_SIZE] ^= 0x01     # Flip a bit of the first port value
+    decoder = FrameDecoder()
+    assert decoder.feed(bytes(frame)) == []
+    assert decoder.rejected == 1
+    assert decoder.feed(encode_frame(MATRIX, 6)) == [(6, MATRIX)]
+
+
+def test_dropped_frames_are_counted_across_wraparound():
+    decoder = FrameDecoder()
+    decoder.feed(encode_frame(MATRIX, 254))
+    decoder.feed(encode_frame(MATRIX, 1))      # 255 and 0 were lost
+    assert decoder.dropped == 2
+
+
+def test_max_dimension():
+    largest = [[0] * MAX_DIMENSION for _ in range(MAX_DIMENSION)]
+    assert FrameDecoder().feed(encode_frame(largest)) == [(0, largest)]
+
+    # A header with impossible dimensions is garbage, the real frame after it is still found
+    body = bytes([0, MAX_DIMENSION + 1, 1]) + bytes(MAX_DIMENSION + 1)
+    oversized = SYNC + body + crc16(body).to_bytes(2, 'big')
+    decoder = FrameDecoder()
+    assert decoder.feed(oversized + encode_frame(MATRIX, 9)) == [(9, MATRIX)]
+    assert decoder.rejected == 1
+
+
+@pytest.mark.parametrize('matrix', [[], [[]], [[0]] * (MAX_DIMENSION + 1), [[0] * (MAX_DIMENSION + 1)],
+                                    [[1, 0], [0]], [[128]], [[-129]]])
+def test_encode_rejects_matrices_the_decoder_cannot_read(matrix):
+    with pytest.raises(ValueError):
+        encode_frame(matrix)
@@ -0,0 +1,20 @@
+# Tests for the parallel state generation (stateGenerator(workers > 1)).
+#
+#   python -m pytest test_state_generator.py
+
+import filecmp
+
+import pytest
+
+from state_generator import stateGenerator
+
+
+@pytest.mark.parametrize('options', [{}, {'compact': True}, {'symmetry': True}, {'storage': 'disk'}])
+def test_parallel_export_matches_serial(tmp_path, options):
+    for name, workers in (('serial', 1), ('parallel', 2)):
+        with stateGenerator(2, workers=workers, **options) as generator:
+            generator.export_transitions(str(tmp_path / f'{name}.csv'))
+            generator.export_transitions(str(tmp_path / f'{name}.bin'))
+
+    assert filecmp.cmp(tmp_path / 'serial.csv', tmp_path / 'parallel.csv', shallow=False)
+    assert filecmp.cmp(tmp_path / 'serial.bin', tmp_path / 'parallel.bin', shallow=False)
@@ -0,0 +1,372 @@
+# Binary on-disk transition store.
+#
+# Replaces parsing transitions.csv with eval(): states are stored as packed
+# integer codes (see stateEncoding.py), actions as a string table and the
+# transition relation as CSR adjacency arrays. The file is memory-mapped
+# read-only, so processes that open the same file share the pages. Consumers
+# query it through read-only views (state_set, transition_table,
+# checker_transitions) that decode the states they are asked for instead of
+# copying the relation into dicts.
+#
+# Layout (little-endian, every section starts on an 8 byte boundary):
+#   header       HEADER struct below, ends with a SHA-256 of the content
+#   states       uint8[num_states, state_bytes]  big-endian codes, sorted
+#   actions      S<action_width>[num_actions]     sorted action strings
+#   indptr       int64[num_states + 1]            edges of state i are indptr[i]:indptr[i+1]
+#   indices      uint32[num_edges]                target state index
+#   edge_actions uint32[num_edges]                action index
+
+import csv
+import hashlib
+import mmap
+import struct
+from bisect import bisect_left
+from collections import OrderedDict
+from collections.abc import Mapping, Set
+
+import numpy as np
+
+from stateEncoding import StateEncoder, state_text
+
+MAGIC = b'DFATRANS'
+VERSION = 1
+FLAG_SYMMETRY_REDUCED = 1   # Only representatives of each module relabeling class are stored
+
+HEADER = struct.Struct('<8sHHIIIIQQQ32s')
+
+
+def _align(offset):
+    return (offset + 7) & ~7
+
+
+def _section_layout(num_states, state_bytes, num_actions, action_width, num_edges):
+    sections = [
+        ('states', np.uint8, (num_states, state_bytes)),
+        ('actions', f'S{action_width}', (num_actions,)),
+        ('indptr', np.int64, (num_states + 1,)),
+        ('indices', np.uint32, (num_edges,)),
+        ('edge_actions', np.uint32, (num_edges,)),
+    ]
+    layout = []
+    offset = _align(HEADER.size)
+    for name, dtype, shape in sections:
+        layout.append((name, dtype, shape, offset))
+        offset = _align(offset + int(np.prod(shape)) * np.dtype(dtype).itemsize)
+    return layout
+
+
+def _content_hash(header_fields, arrays):
+    digest = hashlib.sha256(repr(header_fields).encode())
+    for array in arrays:
+        digest.update(np.ascontiguousarray(array).tobytes())
+    return digest.digest()
+
+
+def is_transition_store(filename):
+    with open(filename, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def write_transition_store(filename, transitions, encoder, states=None, symmetry_reduced=False):
+    """Writes a {(from_state, action): to_state} table (stateGenerator/DFA format).
+    States may be frozensets or packed ints; states without outgoing transitions can be
+    passed in states so they are kept in the state table."""
+    def pack(state):
+        return state if isinstance(state, int) else encoder.encode(state)
+
+    codes = set(pack(state) for state in states) if states is not None else set()
+    edges = []
+    for (from_state, action), to_state in transitions.items():
+        from_code, to_code = pack(from_state), pack(to_state)
+        codes.add(from_code)
+        codes.add(to_code)
+        edges.append((from_code, action, to_code))
+
+    codes = sorted(codes)
+    index = {code: idx for idx, code in enumerate(codes)}
+    action_names = sorted(set(action for _, action, _ in edges))
+    action_index = {action: idx for idx, action in enumerate(action_names)}
+    edges = sorted((index[f], action_index[a], index[t]) for f, a, t in edges)
+
+    num_states, num_edges = len(codes), len(edges)
+    state_bytes = max(1, -(-encoder.num_slots * encoder.slot_bits // 8))
+    edge_array = np.array(edges, dtype=np.int64).reshape(num_edges, 3)
+    arrays = {
+        'states': np.frombuffer(b''.join(code.to_bytes(state_bytes, 'big') for code in codes),
+                                dtype=np.uint8).reshape(num_states, state_bytes),
+        'indptr': np.concatenate(([0], np.cumsum(np.bincount(edge_array[:, 0], minlength=num_states)))).astype(np.int64),
+        'indices': edge_array[:, 2].astype(np.uint32),
+        'edge_actions': edge_array[:, 1].astype(np.uint32),
+    }
+    return stream_transition_store(filename, encoder, num_states, action_names, num_edges,
+                                   lambda name: [arrays[name]], symmetry_reduced)
+
+
+def stream_transition_store(filename, encoder, num_states, action_names, num_edges, sections, symmetry_reduced=False):
+    """Writes a store section by section. sections(name) yields the arrays of the 'states', 'indptr',
+    'indices' and 'edge_actions' sections in chunks, in file order, so the transition relation never
+    has to be in memory at once (see DiskStore.export_store). action_names has to be sorted."""
+    state_bytes = max(1, -(-encoder.num_slots * encoder.slot_bits // 8))
+    action_width = max([len(action) for action in action_names] + [1])
+    num_actions = len(action_names)
+
+    flags = FLAG_SYMMETRY_REDUCED if symmetry_reduced else 0
+    fields = (VERSION, flags, encoder.num_modules, encoder.slot_bits, state_bytes, action_width,
+              num_states, num_actions, num_edges)
+    layout = _section_layout(num_states, state_bytes, num_actions, action_width, num_edges)
+    digest = hashlib.sha256(repr(fields).encode())     # Same hash as _content_hash over the whole arrays
+
+    with open(filename, 'wb') as f:
+        f.write(b'\0' * HEADER.size)   # The header is written last, once the content hash is known
+        for name, dtype, shape, offset in layout:
+            f.write(b'\0' * (offset - f.tell()))
+            if name == 'actions':
+                chunks = [np.array([action.encode() for action in action_names], dtype=f'S{action_width}')]
+            else:
+                chunks = sections(name)
+            size = 0
+            for chunk in chunks:
+                data = np.ascontiguousarray(chunk, dtype=dtype).tobytes()
+                digest.update(data)
+                f.write(data)
+                size += len(data)
+            if size != int(np.prod(shape)) * np.dtype(dtype).itemsize:
+                raise ValueError(f"Section {name} of {filename} has {size} bytes, expected {shape} of {np.dtype(dtype)}")
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, *fields, digest.digest()))
+
+    return digest.hexdigest()
+
+
+class TransitionStore:
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        (magic, version, flags, num_modules, slot_bits, state_bytes, action_width,
+         num_states, num_actions, num_edges, content_hash) = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{filename} is not a transition store")
+        if version != VERSION:
+            raise ValueError(f"{filename} has store version {version}, expected {VERSION}")
+
+        self._fields = (version, flags, num_modules, slot_bits, state_bytes, action_width,
+                        num_states, num_actions, num_edges)
+        self.num_modules = num_modules
+        self.symmetry_reduced = bool(flags & FLAG_SYMMETRY_REDUCED)
+        self.content_hash = content_hash.hex()
+        self.encoder = StateEncoder(num_modules)
+        if self.encoder.slot_bits != slot_bits:
+            raise ValueError(f"{filename} uses {slot_bits} bits per port, expected {self.encoder.slot_bits}")
+
+        for name, dtype, shape, offset in _section_layout(num_states, state_bytes, num_actions, action_width, num_edges):
+            count = int(np.prod(shape))
+            array = np.frombuffer(self._mmap, dtype=dtype, count=count, offset=offset).reshape(shape)
+            setattr(self, name, array)
+
+        self.action_names = [action.decode() for action in self.actions]
+        # Rows of the state table as byte strings, they sort like the big-endian codes
+        self._keys = self.states.view(f'V{state_bytes}').ravel()
+
+    # Reopen the mapping instead of copying the arrays when sent to another process
+    def __getstate__(self):
+        return {'filename': self.filename}
+
+    def __setstate__(self, state):
+        self.__init__(state['filename'])
+
+    def __len__(self):
+        return len(self.states)
+
+    @property
+    def num_edges(self):
+        return len(self.indices)
+
+    def verify(self):
+        """Recomputes the content hash, returns True if the file is intact."""
+        arrays = [self.states, self.actions, self.indptr, self.indices, self.edge_actions]
+        return _content_hash(self._fields, arrays).hex() == self.content_hash
+
+    def state_code(self, idx):
+        return int.from_bytes(self.states[idx].tobytes(), 'big')
+
+    def state(self, idx, compact=False):
+        code = self.state_code(idx)
+        return code if compact else self.encoder.decode(code)
+
+    def index_of(self, state):
+        """Index of a state (frozenset or packed int), binary search over the sorted table."""
+        code = state if isinstance(state, int) else self.encoder.encode(state)
+        key = np.void(code.to_bytes(self.states.shape[1], 'big'))
+        idx = int(np.searchsorted(self._keys, key))
+        if idx == len(self._keys) or self._keys[idx] != key:
+            raise KeyError(state)
+        return idx
+
+    def find(self, state):
+        """Index of a state, None if it is not in the store or cannot be encoded for it."""
+        try:
+            return self.index_of(state)
+        except (KeyError, ValueError, OverflowError):
+            return None
+
+    def successors(self, idx):
+        start, end = int(self.indptr[idx]), int(self.indptr[idx + 1])
+        names = self.action_names
+        return [(names[a], t) for a, t in zip(self.edge_actions[start:end].tolist(), self.indices[start:end].tolist())]
+
+    def target(self, idx, action):
+        """Index of the state action leads to from state idx, None if it is not a transition."""
+        action_idx = bisect_left(self.action_names, action)
+        if action_idx == len(self.action_names) or self.action_names[action_idx] != action:
+            return None
+        start, end = self.indptr[idx], self.indptr[idx + 1]
+        hits = np.flatnonzero(self.edge_actions[start:end] == action_idx)
+        return int(self.indices[start + hits[0]]) if len(hits) else None
+
+    def all_states(self, compact=False):
+        return [self.state(idx, compact) for idx in range(len(self.states))]
+
+    # Read-only views in the formats of the other modules, rows are decoded when they are
+    # looked up so nothing is copied out of the mapping
+    def state_set(self, compact=False):
+        """Set of all states."""
+        return StoreStates(self, compact)
+
+    def transition_table(self, compact=False):
+        """{(from_state, action): to_state} as used by stateGenerator and DFA."""
+        return StoreTransitionTable(self, compact)
+
+    def checker_transitions(self, compact=False):
+        """{from_state: [(action, to_state)]} as used by ModelChecker, without self-loops."""
+        return StoreSuccessors(self, compact)
+
+    def export_csv(self, filename='transitions.csv', decode=True):
+        with open(filename, mode='w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['From State', 'Action', 'To State'])
+            for (from_state, action), to_state in self.transition_table(compact=not decode).items():
+                writer.writerow([state_text(from_state), action, state_text(to_state)])
+
+        print(f"Transitions exported to {filename}")
+
+    def close(self):
+        for name in ('states', 'actions', 'indptr', 'indices', 'edge_actions', '_keys'):
+            setattr(self, name, None)
+        self._mmap.close()
+
+
+class _StoreView:
+    def __init__(self, store, compact=False, cache_size=100000):
+        self.store = store
+        self.compact = compact      # Packed integer states instead of frozensets
+        self.content_hash = store.content_hash     # Used by PlanCache instead of hashing the relation
+        self.cache_size = cache_size
+        # Bounded LRU caches of decoded states and their indices, most recently used last, so
+        # searches that revisit states do not decode and search the state table again
+        self._states = OrderedDict()
+        self._indices = OrderedDict()
+        self._rows = OrderedDict()      # Decoded successor lists of StoreSuccessors
+
+    # Caches are rebuilt instead of pickled, the store reopens its mapping
+    def __getstate__(self):
+        return {'store': self.store, 'compact': self.compact, 'cache_size': self.cache_size}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def __len__(self):
+        return len(self.store)
+
+    def _remember(self, cache, key, value):
+        cache[key] = value
+        if len(cache) > self.cache_size:
+            cache.popitem(last=False)
+
+    def _state(self, idx):
+        state = self._states.get(idx)
+        if state is None:
+            state = self.store.state(idx, self.compact)
+            self._remember(self._states, idx, state)
+        else:
+            self._states.move_to_end(idx)
+        return state
+
+    def _find(self, state):
+        idx = self._indices.get(state)
+        if idx is None:
+            idx = self.store.find(state)
+            if idx is not None:
+                self._remember(self._indices, state, idx)
+        else:
+            self._indices.move_to_end(state)
+        return idx
+
+
+class StoreStates(_StoreView, Set):
+    def __contains__(self, state):
+        return self._find(state) is not None
+
+    def __iter__(self):
+        return (self._state(idx) for idx in range(len(self.store)))
+
+
+class StoreTransitionTable(_StoreView, Mapping):
+    def __getitem__(self, key):
+        from_state, action = key
+        idx = self._find(from_state)
+        target = self.store.target(idx, action) if idx is not None else None
+        if target is None:
+            raise KeyError(key)
+        return self._state(target)
+
+    def __contains__(self, key):
+        idx = self._find(key[0])
+        return idx is not None and self.store.target(idx, key[1]) is not None
+
+    def __iter__(self):
+        for idx in range(len(self.store)):
+            state = self._state(idx)
+            for action, _ in self.store.successors(idx):
+                yield state, action
+
+    def __len__(self):
+        return self.store.num_edges
+
+    def items(self):
+        """((from_state, action), to_state) pairs, every source state is decoded once."""
+        for idx in range(len(self.store)):
+            state = self._state(idx)
+            for action, target in self.store.successors(idx):
+                yield (state, action), self._state(target)
+
+
+class StoreSuccessors(_StoreView, Mapping):
+    def __getitem__(self, state):
+        idx = self._find(state)
+        if idx is None:
+            raise KeyError(state)
+        return self._row(idx)
+
+    def __contains__(self, state):
+        return self._find(state) is not None
+
+    def __iter__(self):
+        return (self._state(idx) for idx in range(len(self.store)))
+
+    def _row(self, idx):
+        row = self._rows.get(idx)
+        if row is None:
+            row = [(action, self._state(target)) for action, target in self.store.successors(idx) if target != idx]
+            self._remember(self._rows, idx, row)
+        else:
+            self._rows.move_to_end(idx)
+        return row
+
+    def items(self):
+        for idx in range(len(self.store)):
+            yield self._state(idx), self._row(idx)
+
+    def values(self):
+        return (self._row(idx) for idx in range(len(self.store)))